@@ -0,0 +1,112 @@
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+from client.messenger import MessengerClient
+from common.proxyclient import ProxyClient
+from proxy.backends import BackendMap, parse_backend
+from proxy.proxy import Proxy
+
+
+REPLICAS = 3
+TUNNELS_PER_REPLICA = 10
+MAPPED_PORT = 9000
+CHECK_INTERVAL = 0.5
+STARTUP_TIMEOUT = 10.0
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(port: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, 'startmessenger.py', '-p', str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(('localhost', port), 1).close()
+            return process
+        except OSError:
+            if time.monotonic() > deadline:
+                process.kill()
+                raise
+            time.sleep(0.1)
+
+
+def connect(proxy_port: int, port: int) -> MessengerClient:
+    client = MessengerClient(ProxyClient('localhost', proxy_port, port))
+    client.checkusername('probe')
+    return client
+
+
+def disconnect(clients: List[MessengerClient]) -> None:
+    for client in clients:
+        with contextlib.suppress(OSError):
+            client.client.sock.shutdown(socket.SHUT_RDWR)
+        client.client.sock.close()
+        client.client.read_thread.join()
+
+
+def report(name: str, ok: bool, detail: str) -> bool:
+    print(f'{name:<24}{"ok" if ok else "FAILED":>8}  {detail}')
+    return ok
+
+
+def main() -> None:
+    ports = [free_port() for _ in range(REPLICAS)]
+    processes = [start_backend(port) for port in ports]
+    spec = f'{MAPPED_PORT}=' + ','.join(f'localhost:{port}' for port in ports)
+    backends = BackendMap(dict([parse_backend(spec)]), check_interval=CHECK_INTERVAL)
+    replicas = backends.backends[MAPPED_PORT].replicas
+    clients: List[MessengerClient] = []
+    results = []
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            proxy = Proxy(0, backends=backends)
+            proxy_port = proxy.sock.getsockname()[1]
+            threading.Thread(target=proxy.listen, daemon=True).start()
+            time.sleep(0.2)
+            clients += [connect(proxy_port, MAPPED_PORT)
+                        for _ in range(REPLICAS * TUNNELS_PER_REPLICA)]
+            spread = [replica.connections for replica in replicas]
+
+            processes[0].kill()
+            processes[0].wait()
+            deadline = time.monotonic() + CHECK_INTERVAL * (backends.max_failures + 2)
+            while replicas[0].healthy and time.monotonic() < deadline:
+                time.sleep(0.1)
+            clients += [connect(proxy_port, MAPPED_PORT) for _ in range(TUNNELS_PER_REPLICA)]
+            time.sleep(0.2)
+            ejected = [replica.connections for replica in replicas]
+
+            clients.append(connect(proxy_port, ports[1]))
+            after = [replica.connections for replica in replicas]
+        results.append(report('least-connections', max(spread) - min(spread) <= 1,
+                              f'tunnels per replica {spread}'))
+        results.append(report('ejection', not replicas[0].healthy and ejected[0] == spread[0],
+                              f'tunnels per replica {ejected} after killing the first'))
+        results.append(report('unmapped fallback', ejected == after,
+                              f'port {ports[1]} reached directly, replicas {after}'))
+    finally:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull):
+            disconnect(clients)
+            time.sleep(0.2)
+        for process in processes:
+            process.kill()
+            process.wait()
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+from datetime import datetime
+import pickle
+import timeit
+from typing import Any, Callable, List, Tuple
+from uuid import uuid4
+
+from common.codec import COMPACT, PICKLE, Codec
+from common.packet import HEADER, Packet
+from messenger.messenger import InboxItem, MessageItem, MessengerRequest, \
+    RequestType as MessengerRequestType
+from mediastream.mediastream import MediaStreamRequest, \
+    RequestType as MediaStreamRequestType
+
+
+def samples() -> List[Tuple[str, Any]]:
+    now = datetime.now()
+    uid = uuid4()
+    return [
+        ('Signup', MessengerRequest(MessengerRequestType.Signup, ('alice', 'secret'))),
+        ('Login', MessengerRequest(MessengerRequestType.Login, ('alice', 'secret'))),
+        ('GetInbox', MessengerRequest(MessengerRequestType.GetInbox, ())),
+        ('SendMessage', MessengerRequest(MessengerRequestType.SendMessage,
+                                         ('bob', 'hello there, how are you?'))),
+        ('ReadMessages', MessengerRequest(MessengerRequestType.ReadMessages, ('bob', 20))),
+        ('CheckUsername', MessengerRequest(MessengerRequestType.CheckUsername, ('alice',))),
+        ('Logout', MessengerRequest(MessengerRequestType.Logout, ())),
+        ('InboxItem x50', [InboxItem(f'user{i}', now, i % 3) for i in range(50)]),
+        ('MessageItem x20', [MessageItem('alice', 'bob', f'message number {i}', now, i % 2 == 0)
+                             for i in range(20)]),
+        ('GetList', MediaStreamRequest(MediaStreamRequestType.GetList, ())),
+        ('StartStream', MediaStreamRequest(MediaStreamRequestType.StartStream, ('movie.mp4',))),
+        ('GetNextFrame', MediaStreamRequest(MediaStreamRequestType.GetNextFrame, (uid,))),
+        ('CloseStream', MediaStreamRequest(MediaStreamRequestType.CloseStream, (uid,))),
+        ('StartStream response', (uid, 29.97)),
+    ]
+
+
+def measure(function: Callable[[], Any], number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+
+def legacy(data: Any, number: int) -> Tuple[int, float, float]:
+    packet = Packet(data)
+    header, body = packet.encode_legacy()
+    return (len(header) + len(body),
+            measure(packet.encode_legacy, number),
+            measure(lambda: pickle.loads(body), number))
+
+
+def binary(data: Any, codec: Codec, number: int) -> Tuple[int, float, float]:
+    packet = Packet(data)
+    header, body = packet.encode(codec)
+    _, flags, _ = HEADER.unpack(header)
+    assert Packet.decode(flags, packet.message_id.bytes, body).data == data
+    return (len(header) + len(body),
+            measure(lambda: packet.encode(codec), number),
+            measure(lambda: Packet.decode(flags, packet.message_id.bytes, body), number))
+
+
+def main(number: int = 5000) -> None:
+    print(f'{"request":<22}{"mode":<16}{"bytes":>8}{"encode us":>12}{"decode us":>12}')
+    for name, data in samples():
+        rows = [('legacy pickle', legacy(data, number)),
+                ('binary pickle', binary(data, PICKLE, number)),
+                ('binary compact', binary(data, COMPACT, number))]
+        for mode, (size, encode, decode) in rows:
+            print(f'{name:<22}{mode:<16}{size:>8}{encode:>12.2f}{decode:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
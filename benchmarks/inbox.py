@@ -0,0 +1,64 @@
+import time
+from typing import Callable
+from uuid import UUID, uuid4
+
+from messenger.chat import Chat
+from messenger.messenger import Messenger
+from messenger.user import User
+
+
+def scan_unread(chat: Chat, user: User) -> int:
+    return len([message for message in chat.messages
+                if not message.seen and message.receiver.username == user.username])
+
+
+def login(messenger: Messenger, username: str) -> UUID:
+    client_id = uuid4()
+    messenger.users[username] = User(username, b'')
+    messenger.directory.add(username)
+    messenger.onlines[client_id] = messenger.users[username]
+    return client_id
+
+
+def populate(messenger: Messenger, contacts: int, history: int) -> UUID:
+    owner_id = login(messenger, 'owner')
+    owner = messenger.onlines[owner_id]
+    for i in range(contacts):
+        contact_id = login(messenger, f'contact{i}')
+        for j in range(history):
+            if j % 2:
+                messenger.send_message(owner_id, f'contact{i}', f'message {j}')
+            else:
+                messenger.send_message(contact_id, 'owner', f'message {j}')
+        messenger.read_messages(owner_id, f'contact{i}', history // 2)
+        chat = owner.chats[f'contact{i}']
+        assert chat.unread_count(owner) == scan_unread(chat, owner)
+    return owner_id
+
+
+def measure(name: str, function: Callable[[], object], number: int) -> None:
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    elapsed = (time.perf_counter() - start) / number
+    print(f'{name:<48}{elapsed * 1e3:>10.3f} ms')
+
+
+def main() -> None:
+    for contacts, history in ((10, 10_000), (100, 2_000), (1_000, 200)):
+        messenger = Messenger(0)
+        client_id = populate(messenger, contacts, history)
+        owner = messenger.onlines[client_id]
+        print(f'{contacts} chats x {history} messages')
+        measure('  get_inbox (first page of 20)',
+                lambda: messenger.get_inbox(client_id, 0, 20), 200)
+        measure('  get_inbox (every chat)', lambda: messenger.get_inbox(client_id), 20)
+        measure('  unread for every chat (full scan)',
+                lambda: [scan_unread(chat, owner) for chat in owner.chats.values()], 5)
+        measure('  read_messages(contact, 20)',
+                lambda: messenger.read_messages(client_id, 'contact0', 20), 200)
+        messenger.sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import statistics
+import threading
+import time
+from typing import List
+
+from client.messenger import MessengerClient
+from common.tcpclient import TCPClient
+from messenger.messenger import Messenger, MessengerError
+
+
+def connect(port: int) -> MessengerClient:
+    return MessengerClient(TCPClient('localhost', port))
+
+
+def storm(port: int, logins: int, stop: threading.Event) -> None:
+    client = connect(port)
+    for _ in range(logins):
+        if stop.is_set():
+            break
+        try:
+            client.login('stormer', 'password')
+        except MessengerError:
+            pass
+    client.client.exit()
+
+
+def send_latencies(client: MessengerClient, duration: float) -> List[float]:
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        client.send_message('receiver', 'hello')
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{name:<32}{len(latencies):>8} sends'
+          f'{quantiles[49] * 1e3:>10.3f} ms p50'
+          f'{quantiles[98] * 1e3:>10.3f} ms p99'
+          f'{max(latencies) * 1e3:>10.3f} ms max')
+
+
+def main() -> None:
+    messenger = Messenger(0)
+    port = messenger.sock.getsockname()[1]
+    threading.Thread(target=messenger.listen, daemon=True).start()
+    client = connect(port)
+    for username in ('sender', 'receiver', 'stormer'):
+        client.signup(username, 'password')
+    client.login('sender', 'password')
+
+    report('no logins', send_latencies(client, 2.0))
+    for stormers in (8, 32, 128):
+        stop = threading.Event()
+        threads = [threading.Thread(target=storm, args=(port, 1_000, stop))
+                   for _ in range(stormers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        latencies = send_latencies(client, 3.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        report(f'{stormers} clients logging in', latencies)
+    client.client.exit()
+    messenger.hasher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import contextlib
+import os
+
+from benchmarks.segments import video_server
+from client.media_ui import MediaUI
+from client.mediastream import MediaStreamClient
+from common.tcpclient import TCPClient
+
+
+def play(port: int, push: bool, decoders: int) -> None:
+    client = MediaStreamClient(TCPClient('localhost', port))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stats = MediaUI(client, 'video.avi', push=push, decoders=decoders, headless=True).show()
+    name = f'{"push" if push else "pull"}, {decoders} decoders'
+    print(f'{name:<32}{stats.presented:>8} frames{stats.dropped:>8} dropped'
+          f'{stats.fps:>10.1f} fps')
+    client.client.exit()
+
+
+def main() -> None:
+    with video_server(600, 1920, 1080, 60) as (_, port):
+        for push in (False, True):
+            for decoders in (1, 2, 4):
+                play(port, push, decoders)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import contextlib
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import resource
+import socket
+import threading
+import time
+from typing import Optional
+
+from proxy.pipe import SPLICE_SUPPORTED
+from proxy.proxy import Proxy
+
+
+TUNNELS = 8
+MEGABYTES_PER_TUNNEL = 256
+CHUNK_SIZE = 48 * 1024
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def drain(sock: socket.socket) -> None:
+    buffer = bytearray(1 << 20)
+    with sock:
+        while sock.recv_into(buffer):
+            pass
+
+
+def sink() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('localhost', 0))
+    sock.listen(socket.SOMAXCONN)
+
+    def accept() -> None:
+        while True:
+            client, _ = sock.accept()
+            threading.Thread(target=drain, args=(client,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return sock.getsockname()[1]
+
+
+def run_proxy(splice: bool, conn: Connection) -> None:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        proxy = Proxy(0, 1, splice)
+        threading.Thread(target=proxy.listen, daemon=True).start()
+        conn.send(proxy.sock.getsockname()[1])
+        while conn.recv() is not None:
+            conn.send(cpu_time())
+
+
+def send(port: int, target: Optional[int]) -> None:
+    chunk = os.urandom(CHUNK_SIZE)
+    with socket.create_connection(('localhost', port)) as sock:
+        if target is not None:
+            sock.sendall(f'{target}\n'.encode('utf-8'))
+        for _ in range(MEGABYTES_PER_TUNNEL * 1024 * 1024 // CHUNK_SIZE):
+            sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+        sock.recv(1)
+
+
+def transfer(port: int, target: Optional[int]) -> float:
+    threads = [threading.Thread(target=send, args=(port, target)) for _ in range(TUNNELS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def report(name: str, elapsed: float, cpu: Optional[float] = None) -> None:
+    throughput = TUNNELS * MEGABYTES_PER_TUNNEL / elapsed
+    usage = f'{cpu / elapsed:>10.0%}' if cpu is not None else f'{"-":>10}'
+    print(f'{name:<16}{throughput:>12.1f} MB/s{usage}')
+
+
+def main() -> None:
+    target = sink()
+    print(f'{"mode":<16}{"throughput":>17}{"proxy cpu":>10}')
+    report('direct', transfer(target, None))
+    modes = [('recv_into', False)] + ([('splice', True)] if SPLICE_SUPPORTED else [])
+    for name, splice in modes:
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=run_proxy, args=(splice, child_conn))
+        process.start()
+        port = conn.recv()
+        time.sleep(0.2)
+        conn.send(True)
+        start = conn.recv()
+        elapsed = transfer(port, target)
+        conn.send(True)
+        report(name, elapsed, conn.recv() - start)
+        conn.send(None)
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
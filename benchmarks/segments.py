@@ -0,0 +1,85 @@
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from common.codec import Buffer
+from common.packet import Packet, send_buffers
+from mediastream.framecache import FrameCache, FrameSource
+from mediastream.mediastream import MediaStreamServer
+from mediastream.segmentstore import SegmentStore
+
+
+def make_video(path: str, frames: int, width: int, height: int, fps: float) -> None:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for i in range(frames):
+        frame = np.full((height, width, 3), i % 256, dtype=np.uint8)
+        cv2.circle(frame, (i * 7 % width, height // 2), height // 4, (0, 0, 255), -1)
+        cv2.putText(frame, str(i), (20, height - 20), cv2.FONT_HERSHEY_SIMPLEX,
+                    2, (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+
+@contextlib.contextmanager
+def video_server(frames: int, width: int, height: int, fps: float,
+                 **options: Any) -> Iterator[Tuple[MediaStreamServer, int]]:
+    with tempfile.TemporaryDirectory() as directory:
+        make_video(os.path.join(directory, 'video.avi'), frames, width, height, fps)
+        server = MediaStreamServer(0, directory, **options)
+        threading.Thread(target=server.listen, daemon=True).start()
+        time.sleep(0.2)
+        yield server, server.sock.getsockname()[1]
+
+
+def drain(sock: socket.socket) -> None:
+    while sock.recv(1 << 20):
+        pass
+
+
+def serve(frame: Callable[[int], Optional[Buffer]]) -> float:
+    sender, receiver = socket.socketpair()
+    draining_thread = threading.Thread(target=drain, args=(receiver,))
+    draining_thread.start()
+    index = 0
+    start = time.process_time()
+    while (data := frame(index)) is not None:
+        send_buffers(sender, Packet(data).encode())
+        index += 1
+    elapsed = time.process_time() - start
+    sender.close()
+    draining_thread.join()
+    receiver.close()
+    return index / elapsed
+
+
+def main() -> None:
+    cv2.setNumThreads(1)
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    with tempfile.TemporaryDirectory() as directory:
+        if path is None:
+            path = os.path.join(directory, 'video.avi')
+            make_video(path, 300, 1280, 720, 30)
+        store = SegmentStore(os.path.join(directory, 'segments'))
+        start = time.perf_counter()
+        store.transcode(path)
+        print(f'{"transcode once":<32}{time.perf_counter() - start:>10.2f} s')
+        live = FrameSource(path, FrameCache(0))
+        segment = store.open(path)
+        fps = live.fps
+        for name, frame in (('live encoding', live.frame), ('mmap segments', segment.frame)):
+            frames_per_second = serve(frame)
+            print(f'{name:<32}{frames_per_second:>10.0f} frames/s per core'
+                  f'{frames_per_second / fps:>10.1f} streams at {fps:.0f} fps')
+        live.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import gc
+import os
+import sys
+import threading
+import time
+from typing import List
+
+from benchmarks.segments import video_server
+from client.mediastream import MediaStreamClient
+from common.tcpclient import TCPClient
+from mediastream.decodepool import DecodePool
+from mediastream.mediastream import MediaStreamServer
+
+
+ROUNDS = 10
+STREAMS_PER_ROUND = 200
+IDLE_TIMEOUT = 1.0
+MAX_GROWTH = 0.1
+
+
+def rss() -> int:
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def abandon(port: int, i: int, idle: List[TCPClient]) -> None:
+    client = MediaStreamClient(TCPClient('localhost', port))
+    if i % 2:
+        client.start_push_stream('video.avi', lambda frame: None, 8)
+    else:
+        uid, _ = client.start_stream('video.avi')
+        if i % 4 == 0:
+            client.close_stream(uid)
+            client.client.exit()
+            return
+        client.get_next_frames(uid, 4).wait()
+    time.sleep(0.05)
+    if i % 4 < 2:
+        client.client.exit()
+    else:
+        idle.append(client.client)
+
+
+def wait_until_closed(server: MediaStreamServer, timeout: float) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if not server.streams:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def main() -> None:
+    pool = DecodePool(max_buffered_bytes=16 * 1024 * 1024)
+    with video_server(300, 1280, 720, 30, decode_pool=pool,
+                      idle_timeout=IDLE_TIMEOUT) as (server, port):
+        baseline = None
+        print(f'{"round":<8}{"streams":>10}{"open":>8}{"threads":>10}{"buffered":>12}'
+              f'{"rss":>12}')
+        for round in range(ROUNDS):
+            idle: List[TCPClient] = []
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                with ThreadPoolExecutor(32) as executor:
+                    list(executor.map(lambda i: abandon(port, i, idle),
+                                      range(STREAMS_PER_ROUND)))
+                closed = wait_until_closed(server, IDLE_TIMEOUT + 10)
+                for client in idle:
+                    client.exit()
+            time.sleep(0.5)
+            gc.collect()
+            memory = rss()
+            if round == 0:
+                baseline = memory
+            stats = pool.stats()
+            print(f'{round:<8}{(round + 1) * STREAMS_PER_ROUND:>10}'
+                  f'{len(server.streams):>8}{threading.active_count():>10}'
+                  f'{stats.buffered_bytes:>12}{memory / 1024 / 1024:>10.1f}MB'
+                  f'{"" if closed else "  streams left open"}')
+        growth = (memory - baseline) / baseline
+        print(f'rss growth after round 0: {growth:.1%}')
+        if growth > MAX_GROWTH or server.streams or pool.stats().buffered_bytes:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
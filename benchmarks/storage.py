@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+from uuid import UUID, uuid4
+
+from messenger.messenger import Messenger
+from messenger.storage import Storage
+from messenger.user import User
+
+
+def login(messenger: Messenger, username: str) -> UUID:
+    client_id = uuid4()
+    if username not in messenger.users:
+        user = User(username, b'')
+        messenger.storage.add_user(user).wait()
+        messenger.users[username] = user
+        messenger.directory.add(username)
+    messenger.onlines[client_id] = messenger.users[username]
+    return client_id
+
+
+def write(messenger: Messenger, senders: int, messages: int) -> float:
+    client_ids = [login(messenger, f'sender{i}') for i in range(senders)]
+    login(messenger, 'owner')
+
+    def send(client_id: UUID) -> None:
+        for j in range(messages):
+            messenger.send_message(client_id, 'owner', f'message {j}')
+
+    threads = [threading.Thread(target=send, args=(client_id,)) for client_id in client_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    for senders, messages in ((1, 2_000), (16, 500), (64, 200)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'messenger.db')
+            messenger = Messenger(0, storage=Storage(path))
+            elapsed = write(messenger, senders, messages)
+            total = senders * messages
+            print(f'{senders} senders x {messages} messages')
+            print(f'  {"durable sends per second":<46}{total / elapsed:>12.0f}')
+            messenger.storage.close()
+            messenger.sock.close()
+
+            start = time.perf_counter()
+            messenger = Messenger(0, storage=Storage(path))
+            elapsed = time.perf_counter() - start
+            print(f'  {"recovery":<46}{elapsed * 1e3:>10.3f} ms')
+            owner = messenger.users['owner']
+            assert len(owner.chats) == senders
+            assert all(chat.size == messages for chat in owner.chats.values())
+            messenger.storage.close()
+            messenger.sock.close()
+
+
+if __name__ == '__main__':
+    main()
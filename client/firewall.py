@@ -1,7 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Set, TypeVar
-
-from build import Any
+from typing import TYPE_CHECKING, Any, Set, TypeVar
 
 if TYPE_CHECKING:
     from common.tcpclient import TCPClient
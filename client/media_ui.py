@@ -1,21 +1,68 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import queue
 import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
 
+from common.tcpclient import Promise
+from mediastream.adaptation import StreamParams
+from mediastream.mediastream import FrameBatch, StreamingError
 from .mediastream import MediaStreamClient
 
 
+FRAME_BATCH_SIZE = 8
+FRAME_QUEUE_SIZE = 16
+DECODE_WORKERS = 2
+POLL_INTERVAL = 0.1
+MAX_LATENESS = 0.5
+PLAYOUT_DELAY = 0.1
+SEEK_KEYS = {ord('a'): -10, ord('d'): 10, ord('s'): -60, ord('w'): 60}
+
+
+@dataclass
+class PlaybackStats:
+    presented: int
+    dropped: int
+    elapsed: float
+
+    @property
+    def fps(self) -> float:
+        return self.presented / self.elapsed if self.elapsed else 0.0
+
+
+def decode(frame: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(frame, dtype=np.uint8)[:, None], cv2.IMREAD_COLOR)
+
+
 class MediaUI:
 
-    def __init__(self, client: MediaStreamClient, filename: str) -> None:
+    def __init__(self, client: MediaStreamClient, filename: str,
+                 prefetch: int = 4 * FRAME_BATCH_SIZE, push: bool = True,
+                 params: Optional[StreamParams] = None, start: float = 0.0,
+                 decoders: int = DECODE_WORKERS, headless: bool = False) -> None:
         self.__filename = filename
         self.__client = client
-        self.__frame_queue = queue.Queue(maxsize=16)
-        self.__uid, self.__fps = self.__client.start_stream(self.__filename)
+        self.__prefetch = max(prefetch, 1)
+        self.__headless = headless
+        self.__frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.__pushed_frames: queue.Queue = queue.Queue()
+        self.__decoder = ThreadPoolExecutor(max(decoders, 1))
+        if push:
+            self.__uid, self.__fps = self.__client.start_push_stream(
+                self.__filename, self.__pushed_frames.put, self.__prefetch, params, start)
+        else:
+            self.__uid, self.__fps = self.__client.start_stream(self.__filename, params, start)
+        self.__interval = 1 / self.__fps if self.__fps > 0 else 0
         self.__finished = False
-        self.__reading_thread = threading.Thread(target=self.__read_frames)
+        self.__skip_until = 0
+        self.__seek_base: Tuple[int, float] = (0, start)
+        self.__reading_thread = threading.Thread(
+            target=self.__receive_frames if push else self.__read_frames)
         self.__reading_thread.start()
 
     @property
@@ -29,32 +76,130 @@ class MediaUI:
             self.__finished = value
 
     def __read_frames(self) -> None:
-        while True:
-            if self.finished:
-                return
-            frame = self.__client.get_next_frame(self.__uid)
+        inflight: Deque[Promise[FrameBatch]] = deque()
+        received: Dict[int, List[bytes]] = {}
+        position = 0
+        requesting = True
+        batch_size = min(FRAME_BATCH_SIZE, self.__prefetch)
+        while not self.finished:
+            while requesting and len(inflight) * batch_size < self.__prefetch:
+                inflight.append(self.__client.get_next_frames(self.__uid, batch_size))
+            if not inflight:
+                break
+            try:
+                batch = inflight.popleft().wait()
+            except StreamingError:
+                requesting = False
+                continue
+            if not batch.frames:
+                requesting = False
+                continue
+            received[batch.start] = batch.frames
+            while position in received:
+                frames = received.pop(position)
+                for frame in frames:
+                    self.__put(position, frame)
+                    position += 1
+        if not requesting:
+            try:
+                self.__client.close_stream(self.__uid)
+            except StreamingError:
+                pass
+        self.finished = True
+
+    def __receive_frames(self) -> None:
+        consumed = 0
+        position = 0
+        while not self.finished:
+            try:
+                frame = self.__pushed_frames.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
             if frame is None:
-                self.finished = True
+                self.__client.unsubscribe(self.__uid)
+                break
+            self.__put(position, frame)
+            position += 1
+            consumed += 1
+            if consumed >= max(self.__prefetch // 2, 1):
+                self.__client.grant_credits(self.__uid, consumed)
+                consumed = 0
+        self.finished = True
+
+    def __put(self, position: int, frame: bytes) -> None:
+        if position < self.__skip_until:
+            return
+        try:
+            decoded = self.__decoder.submit(decode, frame)
+        except RuntimeError:
+            return
+        while not self.finished:
+            try:
+                self.__frame_queue.put((position, decoded), timeout=POLL_INTERVAL)
                 return
-            frame = np.frombuffer(frame, dtype=np.uint8)[:, None]
-            frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
-            print('putting frame')
-            self.__frame_queue.put(frame)
+            except queue.Full:
+                pass
+
+    def __seek(self, seconds: float) -> None:
+        try:
+            position, seconds = self.__client.seek(self.__uid, max(seconds, 0))
+        except StreamingError:
+            return
+        self.__skip_until = position
+        self.__seek_base = (position, seconds)
+
+    def __timestamp(self, position: int) -> float:
+        base, seconds = self.__seek_base
+        return seconds + (position - base) * self.__interval
+
+    def __stop(self) -> None:
+        self.finished = True
+        threading.Thread(target=self.__client.close_stream,
+                         args=(self.__uid,),
+                         daemon=True).start()
 
-    def show(self) -> None:
+    def show(self) -> PlaybackStats:
+        presented = dropped = 0
+        clock: Optional[Tuple[float, float]] = None
+        started = time.monotonic()
         try:
             while True:
                 if self.finished and self.__frame_queue.empty():
-                    return
-                frame: np.ndarray = self.__frame_queue.get()
-                print('got frame')
-                cv2.imshow(self.__filename, frame)
-                if cv2.waitKey(int(1000 / self.__fps)) & 0xFF == ord("q"):
-                    self.finished = True
-                    threading.Thread(target=self.__client.close_stream,
-                                     args=(self.__uid,),
-                                     daemon=True).start()
-                    return
+                    break
+                try:
+                    position, decoded = self.__frame_queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if position < self.__skip_until:
+                    continue
+                frame: np.ndarray = decoded.result()
+                timestamp = self.__timestamp(position)
+                now = time.monotonic()
+                due = clock[0] + timestamp - clock[1] if clock is not None else now
+                if now - due > self.__interval:
+                    if now - due <= MAX_LATENESS and not self.__frame_queue.empty():
+                        dropped += 1
+                        continue
+                    clock = None
+                if clock is None:
+                    clock = (now + PLAYOUT_DELAY, timestamp)
+                    due = clock[0]
+                if self.__headless:
+                    time.sleep(max(due - now, 0))
+                else:
+                    key = cv2.waitKey(max(int((due - now) * 1000), 1)) & 0xFF
+                    if key == ord("q"):
+                        self.__stop()
+                        break
+                    if key in SEEK_KEYS:
+                        self.__seek(timestamp + SEEK_KEYS[key])
+                        clock = None
+                        continue
+                    cv2.imshow(self.__filename, frame)
+                presented += 1
         finally:
-            cv2.destroyAllWindows()
-            cv2.waitKey(1)
+            self.__decoder.shutdown(wait=False, cancel_futures=True)
+            if not self.__headless:
+                cv2.destroyAllWindows()
+                cv2.waitKey(1)
+        return PlaybackStats(presented, dropped, time.monotonic() - started)
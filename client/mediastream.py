@@ -1,26 +1,69 @@
-from typing import Any, List, Tuple
-from uuid import UUID
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
 
-from common.tcpclient import TCPClient
-from mediastream.mediastream import MediaStreamRequest, RequestType
+from common.tcpclient import Promise, TCPClient
+from mediastream.adaptation import StreamParams
+from mediastream.catalog import MediaList
+from mediastream.framecache import FrameCacheStats
+from mediastream.mediastream import FrameBatch, MediaStreamRequest, RequestType, StreamStats
 
 
 class MediaStreamClient:
 
     def __init__(self, client: TCPClient[MediaStreamRequest, Any]) -> None:
         self.client = client
+        self.subscriptions: Dict[UUID, UUID] = {}
 
     def __ask(self, type: RequestType, *args: Any) -> Any:
         return self.client.ask(MediaStreamRequest(type, args))
 
-    def get_list(self) -> List[str]:
-        return self.__ask(RequestType.GetList)
+    def get_list(self, offset: int = 0, limit: int = 0, filter: str = '') -> MediaList:
+        return self.__ask(RequestType.GetList, offset, limit, filter)
 
-    def start_stream(self, filename: str) -> Tuple[UUID, float]:
-        return self.__ask(RequestType.StartStream, filename)
+    def start_stream(self, filename: str, params: Optional[StreamParams] = None,
+                     start: float = 0.0) -> Tuple[UUID, float]:
+        if params is None and not start:
+            return self.__ask(RequestType.StartStream, filename)
+        return self.__ask(RequestType.StartStream, filename, None, 0, params, start)
+
+    def start_push_stream(self, filename: str, callback: Callable[[Optional[bytes]], None],
+                          credits: int, params: Optional[StreamParams] = None,
+                          start: float = 0.0) -> Tuple[UUID, float]:
+        subscription_id = uuid4()
+        self.client.subscribe(subscription_id, callback)
+        try:
+            uid, fps = self.__ask(RequestType.StartStream, filename, subscription_id, credits,
+                                  params, start)
+        except:
+            self.client.unsubscribe(subscription_id)
+            raise
+        self.subscriptions[uid] = subscription_id
+        return uid, fps
+
+    def grant_credits(self, uid: UUID, credits: int) -> None:
+        self.client.ask_async(MediaStreamRequest(RequestType.GrantCredits, (uid, credits)))
+
+    def unsubscribe(self, uid: UUID) -> None:
+        if uid in self.subscriptions:
+            self.client.unsubscribe(self.subscriptions.pop(uid))
 
     def get_next_frame(self, uid: UUID) -> bytes:
         return self.__ask(RequestType.GetNextFrame, uid)
 
+    def get_next_frames(self, uid: UUID, count: int) -> Promise[FrameBatch]:
+        return self.client.ask_async(MediaStreamRequest(RequestType.GetNextFrames, (uid, count)))
+
+    def seek(self, uid: UUID, seconds: float) -> Tuple[int, float]:
+        return self.__ask(RequestType.Seek, uid, seconds)
+
     def close_stream(self, uid: UUID) -> None:
-        self.__ask(RequestType.CloseStream, uid)
+        try:
+            self.__ask(RequestType.CloseStream, uid)
+        finally:
+            self.unsubscribe(uid)
+
+    def get_cache_stats(self) -> FrameCacheStats:
+        return self.__ask(RequestType.GetCacheStats)
+
+    def get_stream_stats(self) -> List[StreamStats]:
+        return self.__ask(RequestType.GetStreamStats)
@@ -1,20 +1,25 @@
 from abc import ABC, abstractmethod
+from functools import partial
 import threading
-import time
-from typing import Dict, Tuple, Type
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import re
 
 import bcrypt
 
 from common.tcpclient import TCPClient
-from messenger.messenger import MessageItem, MessengerError
-from .media_ui import MediaUI
+from mediastream.adaptation import StreamParams
+from mediastream.catalog import MediaInfo
+from messenger.messenger import MessageItem, MessengerError, SeenReceipt
+from .media_ui import DECODE_WORKERS, FRAME_BATCH_SIZE, MediaUI
 from .mediastream import MediaStreamClient
 from .firewall import Firewall, PacketDropException
 from .messenger import MessengerClient
 from .chat_ui import LockedCurses, WinWrapper
 
 
+MEDIA_PAGE_SIZE = 20
+
+
 class Menu(ABC):
 
     @abstractmethod
@@ -37,11 +42,18 @@ class Menu(ABC):
 
 
 class MainMenu(Menu):
-    def __init__(self, messenger_port: int, stream_port: int) -> None:
+    def __init__(self, messenger_port: int, stream_port: int,
+                 prefetch: int = 4 * FRAME_BATCH_SIZE, push: bool = True,
+                 stream_params: Optional[StreamParams] = None,
+                 decoders: int = DECODE_WORKERS, headless: bool = False) -> None:
         self.__admin_pass_hash: bytes = None
-        self.servers: Dict[str, Tuple[Type[Menu], int]] = {
-            'shalgham': (MessengerMainMenu, messenger_port),
-            'choghondar': (MediaStreamMenu, stream_port),
+        self.sessions: Dict[str, str] = {}
+        self.servers: Dict[str, Tuple[Callable[[TCPClient], Menu], int]] = {
+            'shalgham': (partial(MessengerMainMenu, sessions=self.sessions), messenger_port),
+            'choghondar': (partial(MediaStreamMenu, prefetch=prefetch, push=push,
+                                   stream_params=stream_params, decoders=decoders,
+                                   headless=headless),
+                           stream_port),
         }
 
     def display(self) -> None:
@@ -83,8 +95,9 @@ class MainMenu(Menu):
 
 class MessengerMainMenu(Menu):
 
-    def __init__(self, tcpclient: TCPClient) -> None:
+    def __init__(self, tcpclient: TCPClient, sessions: Dict[str, str]) -> None:
         self.client = MessengerClient(tcpclient)
+        self.sessions = sessions
 
     def display(self) -> None:
         print('1. Sign up')
@@ -113,9 +126,13 @@ class MessengerMainMenu(Menu):
                 self.client.signup(username, password)
             elif cmd == '2':
                 username = input('Please enter your username: ')
-                password = input('Please enter your password: ')
-                self.client.login(username, password)
-                InboxMenu(self.client).run()
+                if not self.__resume(username):
+                    password = input('Please enter your password: ')
+                    self.sessions[username] = self.client.login(username, password)
+                inbox = InboxMenu(self.client)
+                inbox.run()
+                if inbox.logged_out:
+                    del self.sessions[username]
             elif cmd == '3':
                 return True
             else:
@@ -124,37 +141,72 @@ class MessengerMainMenu(Menu):
             print(e.message)
         return False
 
+    def __resume(self, username: str) -> bool:
+        if username not in self.sessions:
+            return False
+        try:
+            self.client.resume(self.sessions[username])
+            return True
+        except MessengerError:
+            del self.sessions[username]
+            return False
+
 
 class InboxMenu(Menu):
 
     def __init__(self, client: MessengerClient) -> None:
         self.client = client
-        self.chat_finished = False
         self.n_messages = 5
+        self.messages: List[MessageItem] = []
+        self.messages_lock = threading.Lock()
+        self.page = 0
+        self.page_size = 20
+        self.logged_out = False
 
     def display(self) -> None:
-        print('Inbox:')
+        print(f'Inbox (page {self.page + 1}):')
         print('\n'.join([
             f'{item.user} {f"({item.unread_count})" if item.unread_count > 0 else ""}'
-            for item in self.client.get_inbox()
+            for item in self.client.get_inbox(self.page * self.page_size, self.page_size)
         ]))
         print('-----------')
+        print('Enter "/page <n>" to see another page of the inbox')
+        print('Enter "/users <prefix>" to search for users')
+        print('Enter "/back" to leave the inbox and stay logged in')
         print('Enter "/exit" to close the messenger')
 
     def action(self, contact: str) -> bool:
         if contact == '/exit':
             self.client.logout()
+            self.logged_out = True
             return True
+        if contact == '/back':
+            return True
+        if mo := re.match(r'^/page\s+(\d+)$', contact):
+            self.page = max(int(mo.group(1)) - 1, 0)
+            return False
+        if mo := re.match(r'^/users(?:\s+(\S+))?$', contact):
+            print('\n'.join(self.client.get_contacts(mo.group(1) or '', 0, self.page_size)))
+            print('-----------')
+            return False
+        try:
+            self.__chat(contact)
+        except MessengerError as e:
+            print(e.message)
+        return False
+
+    def __chat(self, contact: str) -> None:
         try:
             curses = LockedCurses()
             curses.start()
-            self.chat_finished = False
             y, x = curses.getmaxyx()
             messages_win = curses.newwin(y, x, 0, 0)
-            t = threading.Thread(
-                target=self.__show_messages, 
-                args=(messages_win, contact, x, y - 1))
-            t.start()
+            lines = [' ' * x for _ in range(y - 1)]
+            self.messages = []
+            subscription_id = self.client.subscribe(
+                contact, partial(self.__on_push, messages_win, contact, lines))
+            self.__load_messages(contact)
+            self.__show_messages(messages_win, contact, lines)
 
             input_win = curses.newwin(1, x, y - 1, 0)
 
@@ -167,22 +219,48 @@ class InboxMenu(Menu):
                     break
                 if mo := re.match(r'^/load\s+(\d+)$', message):
                     self.n_messages = min(int(mo.group(1)), y - 1)
+                    self.__load_messages(contact)
+                    self.__show_messages(messages_win, contact, lines)
                 else:
                     self.client.send_message(contact, message)
 
-            self.chat_finished = True
-            t.join()
+            self.client.unsubscribe(subscription_id)
         finally:
             curses.teardown()
-        return False
 
-    def __show_messages(self, win: WinWrapper, contact: str, w: int, h: int) -> None:
-        lines = [' ' * w for _ in range(h)]
-        while not self.chat_finished:
-            try:
-                messages = self.client.read_messages(contact, self.n_messages)
-            except:
-                messages = []
+    def __load_messages(self, contact: str) -> None:
+        with self.messages_lock:
+            missing = self.n_messages - len(self.messages)
+            before = self.messages[0].seq if self.messages else None
+        if missing <= 0:
+            return
+        try:
+            messages = self.client.read_messages_before(contact, before, missing)
+        except MessengerError:
+            messages = []
+        with self.messages_lock:
+            self.__merge(messages)
+
+    def __merge(self, messages: List[MessageItem]) -> None:
+        merged = {message.seq: message for message in self.messages}
+        merged.update((message.seq, message) for message in messages)
+        self.messages = [merged[seq] for seq in sorted(merged)][-self.n_messages:]
+
+    def __on_push(self, win: WinWrapper, contact: str, lines: List[str],
+                  item: Union[MessageItem, SeenReceipt]) -> None:
+        with self.messages_lock:
+            if isinstance(item, MessageItem):
+                self.__merge([item])
+            else:
+                for message in self.messages:
+                    if message.receiver == item.reader and message.timestamp <= item.until:
+                        message.seen = True
+        self.__show_messages(win, contact, lines)
+
+    def __show_messages(self, win: WinWrapper, contact: str, lines: List[str]) -> None:
+        with self.messages_lock:
+            h, w = len(lines), len(lines[0])
+            messages = self.messages[-self.n_messages:]
             new_lines = [
                 f"{self.__format_message(message, contact):<{w}}" for message in messages
             ] + [' ' * w for _ in range(h - len(messages) - 1)]
@@ -191,7 +269,6 @@ class InboxMenu(Menu):
                     win.addstr(i, 0, new)
                     lines[i] = new
                     win.refresh()
-            time.sleep(0.1)
 
     def __format_message(self, message: MessageItem, contact: str) -> str:
         return f"{f'({message.sender})' if message.sender == contact else ''} {message.text}"
@@ -199,27 +276,56 @@ class InboxMenu(Menu):
 
 class MediaStreamMenu(Menu):
 
-    def __init__(self, tcpclient: TCPClient) -> None:
+    def __init__(self, tcpclient: TCPClient, prefetch: int, push: bool,
+                 stream_params: Optional[StreamParams] = None,
+                 decoders: int = DECODE_WORKERS, headless: bool = False) -> None:
         self.client = MediaStreamClient(tcpclient)
-        self.files = None
+        self.files: List[MediaInfo] = []
+        self.total = 0
+        self.offset = 0
+        self.filter = ''
+        self.prefetch = prefetch
+        self.push = push
+        self.stream_params = stream_params
+        self.decoders = decoders
+        self.headless = headless
 
     def display(self) -> None:
         print('Welcome to CHOGHONDAR!\nPlease choose a media to display:\n')
         try:
-            self.files = self.client.get_list()
+            media = self.client.get_list(self.offset, MEDIA_PAGE_SIZE, self.filter)
+            self.files, self.total = media.items, media.total
         except PacketDropException:
             print('packet dropped due to firewall rules')
-            self.files = []
+            self.files, self.total = [], 0
         for i, file in enumerate(self.files):
-            print(f'{i + 1}. {file}')
+            minutes, seconds = divmod(round(file.duration), 60)
+            print(f'{i + 1}. {file.name} ({minutes}:{seconds:02} '
+                  f'{file.width}x{file.height} {file.fps:g}fps)')
         print(f'{len(self.files) + 1}. Exit')
+        if self.total > MEDIA_PAGE_SIZE:
+            print(f'showing {self.offset + 1}-{self.offset + len(self.files)} of {self.total}, '
+                  'n: next page, p: previous page')
+        print('/<text>: filter by name, /: clear filter')
 
     def action(self, cmd: str) -> bool:
+        if cmd.startswith('/'):
+            self.filter = cmd[1:].strip()
+            self.offset = 0
+            return False
+        if cmd in ('n', 'p'):
+            offset = self.offset + (MEDIA_PAGE_SIZE if cmd == 'n' else -MEDIA_PAGE_SIZE)
+            if 0 <= offset < self.total:
+                self.offset = offset
+            return False
         if 0 < (idx := int(cmd)) < len(self.files) + 1:
-            file = self.files[idx - 1]
-            print('start playing...')
-            ui = MediaUI(self.client, file)
-            ui.show()
+            file = self.files[idx - 1].name
+            print('start playing... (q: quit, a/d: seek 10s, s/w: seek 1min)')
+            ui = MediaUI(self.client, file, self.prefetch, self.push, self.stream_params,
+                         decoders=self.decoders, headless=self.headless)
+            stats = ui.show()
+            print(f'played {stats.presented} frames in {stats.elapsed:.1f}s '
+                  f'({stats.fps:.1f} fps), dropped {stats.dropped}')
         elif idx == len(self.files) + 1:
             return True
         else:
@@ -1,6 +1,9 @@
-from typing import Any, List
+from typing import Any, Callable, List, Optional, Union
+from uuid import UUID, uuid4
+
 from common.tcpclient import TCPClient
-from messenger.messenger import InboxItem, MessageItem, MessengerRequest, RequestType
+from messenger.messenger import InboxItem, MessageItem, MessagePage, MessengerRequest, \
+    RequestType, SeenReceipt
 
 
 class MessengerClient:
@@ -14,11 +17,17 @@ class MessengerClient:
     def signup(self, username: str, password: str) -> None:
         self.__ask(RequestType.Signup, username, password)
 
-    def login(self, username: str, password: str) -> None:
-        self.__ask(RequestType.Login, username, password)
+    def login(self, username: str, password: str) -> str:
+        return self.__ask(RequestType.Login, username, password)
+
+    def resume(self, token: str) -> str:
+        return self.__ask(RequestType.Resume, token)
 
-    def get_inbox(self) -> List[InboxItem]:
-        return self.__ask(RequestType.GetInbox)
+    def get_inbox(self, offset: int = 0, limit: Optional[int] = None) -> List[InboxItem]:
+        return self.__ask(RequestType.GetInbox, offset, limit)
+
+    def get_contacts(self, prefix: str = '', offset: int = 0, limit: int = 20) -> List[str]:
+        return self.__ask(RequestType.GetContacts, prefix, offset, limit)
 
     def send_message(self, to: str, message: str) -> None:
         self.__ask(RequestType.SendMessage, to, message)
@@ -26,8 +35,32 @@ class MessengerClient:
     def read_messages(self, contact: str, count: int) -> List[MessageItem]:
         return self.__ask(RequestType.ReadMessages, contact, count)
 
+    def read_messages_since(self, contact: str, cursor: int) -> MessagePage:
+        return self.__ask(RequestType.ReadMessagesSince, contact, cursor)
+
+    def read_messages_before(self, contact: str, before: Optional[int],
+                             count: int) -> List[MessageItem]:
+        return self.__ask(RequestType.ReadMessagesBefore, contact, before, count)
+
     def checkusername(self, username: str) -> bool:
         return self.__ask(RequestType.CheckUsername, username)
 
     def logout(self) -> None:
         self.__ask(RequestType.Logout)
+
+    def subscribe(self, contact: str,
+                  callback: Callable[[Union[MessageItem, SeenReceipt]], None]) -> UUID:
+        subscription_id = uuid4()
+        self.client.subscribe(subscription_id, callback)
+        try:
+            self.__ask(RequestType.Subscribe, contact, subscription_id)
+        except:
+            self.client.unsubscribe(subscription_id)
+            raise
+        return subscription_id
+
+    def unsubscribe(self, subscription_id: UUID) -> None:
+        try:
+            self.__ask(RequestType.Unsubscribe, subscription_id)
+        finally:
+            self.client.unsubscribe(subscription_id)
@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+from typing import Generic, List, Set
+from uuid import UUID, uuid4
+
+from .codec import CODECS, PICKLE, Buffer, Codec
+from .packet import HEADER, LEGACY_HEADER_SIZE, Framing, Negotiation, Packet
+from .tcpserver import TCPServer, TRequest, TResponse
+
+
+class AsyncPacketChannel:
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 framing: Framing = Framing.Legacy, codec: Codec = PICKLE) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.codec = codec
+
+    async def read(self) -> Packet:
+        if self.framing == Framing.Legacy:
+            length = int(await self.reader.readexactly(LEGACY_HEADER_SIZE))
+            return pickle.loads(await self.reader.readexactly(length))
+        length, flags, message_id = HEADER.unpack(
+            await self.reader.readexactly(HEADER.size))
+        return Packet.decode(flags, message_id, await self.reader.readexactly(length))
+
+    def encode(self, packet: Packet) -> List[Buffer]:
+        if self.framing == Framing.Legacy:
+            return packet.encode_legacy()
+        return packet.encode(self.codec)
+
+    async def send(self, packet: Packet) -> None:
+        self.writer.writelines(self.encode(packet))
+        await self.writer.drain()
+
+    def push(self, packet: Packet) -> None:
+        if self.writer.is_closing():
+            raise ConnectionError('connection is closed')
+        self.loop.call_soon_threadsafe(self.writer.writelines, self.encode(packet))
+
+
+class AsyncTCPServer(Generic[TRequest, TResponse]):
+
+    def __init__(self, server: TCPServer[TRequest, TResponse],
+                 max_workers: int = 32, max_inflight: int = 16) -> None:
+        self.server = server
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_inflight = max_inflight
+
+    def listen(self) -> None:
+        try:
+            asyncio.run(self.__serve())
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.server.sock.close()
+
+    async def __serve(self) -> None:
+        server = await asyncio.start_server(self.__handle_client,
+                                            sock=self.server.sock, backlog=128)
+        async with server:
+            await server.serve_forever()
+
+    async def __request_job(self, packet: Packet, channel: AsyncPacketChannel,
+                            client_id: UUID, inflight: asyncio.Semaphore) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+            responded = await loop.run_in_executor(self.executor, self.server.respond,
+                                                   client_id, packet)
+            await channel.send(await asyncio.wrap_future(responded))
+        except ConnectionError:
+            pass
+        finally:
+            inflight.release()
+
+    async def __handle_client(self, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> None:
+        client_id = uuid4()
+        peer = writer.get_extra_info('peername')
+        print(f'accepted connection from {peer}')
+        channel = AsyncPacketChannel(reader, writer)
+        inflight = asyncio.Semaphore(self.max_inflight)
+        jobs: Set[asyncio.Task] = set()
+        with self.server.lock:
+            self.server.connections[client_id] = channel
+        try:
+            while True:
+                packet = await channel.read()
+                if isinstance(packet.data, Negotiation):
+                    negotiation = self.server.negotiate(packet.data)
+                    await channel.send(Packet(negotiation, packet.message_id))
+                    channel.framing = negotiation.framings[0]
+                    channel.codec = CODECS[negotiation.codecs[0]]
+                    continue
+                if packet.is_exit:
+                    await asyncio.gather(*jobs)
+                    await channel.send(Packet(None, packet.message_id, is_exit=True))
+                    break
+                await inflight.acquire()
+                job = asyncio.create_task(
+                    self.__request_job(packet, channel, client_id, inflight))
+                jobs.add(job)
+                job.add_done_callback(jobs.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for job in jobs:
+                job.cancel()
+            with self.server.lock:
+                del self.server.connections[client_id]
+            writer.close()
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.server.handle_disconnect, client_id)
+            print(f'closing connection from {peer}')
@@ -0,0 +1,255 @@
+from abc import ABC, abstractmethod
+import copyreg
+import dataclasses
+from datetime import datetime, timedelta
+from enum import Enum
+import io
+import pickle
+import struct
+from typing import Any, Callable, Dict, List, Tuple, TypeVar, Union
+from uuid import UUID
+
+
+Buffer = Union[bytes, bytearray, memoryview]
+TType = TypeVar('TType', bound=type)
+
+
+class BufferPickler(pickle.Pickler):
+    # views into memory-mapped files travel as plain bytes
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[memoryview] = lambda view: (bytes, (view.tobytes(),))
+
+
+def dumps(data: Any) -> bytes:
+    out = io.BytesIO()
+    BufferPickler(out, protocol=pickle.HIGHEST_PROTOCOL).dump(data)
+    return out.getvalue()
+
+
+class Codec(ABC):
+    id: int
+    name: str
+
+    @abstractmethod
+    def encode(self, data: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, body: Buffer) -> Any:
+        pass
+
+
+class PickleCodec(Codec):
+    id = 0
+    name = 'pickle'
+
+    def encode(self, data: Any) -> bytes:
+        return dumps(data)
+
+    def decode(self, body: Buffer) -> Any:
+        return pickle.loads(body)
+
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_BYTES = 6
+TAG_TUPLE = 7
+TAG_LIST = 8
+TAG_DICT = 9
+TAG_UUID = 10
+TAG_DATETIME = 11
+TAG_ENUM = 12
+TAG_DATACLASS = 13
+TAG_PICKLE = 14
+
+FLOAT = struct.Struct('!d')
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(body: Buffer, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = body[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class CompactCodec(Codec):
+    id = 1
+    name = 'compact'
+
+    __tags: Dict[type, int] = {}
+    __types: Dict[int, type] = {}
+    __fields: Dict[type, Tuple[str, ...]] = {}
+
+    @classmethod
+    def register(cls, tag: int) -> Callable[[TType], TType]:
+        def decorator(type_: TType) -> TType:
+            if tag in cls.__types and cls.__types[tag] is not type_:
+                raise ValueError(f'Compact tag {tag} is already used by '
+                                 f'{cls.__types[tag].__name__}')
+            if not (issubclass(type_, Enum) or dataclasses.is_dataclass(type_)):
+                raise TypeError(f'{type_.__name__} is neither an enum nor a dataclass')
+            cls.__tags[type_] = tag
+            cls.__types[tag] = type_
+            if dataclasses.is_dataclass(type_):
+                cls.__fields[type_] = tuple(field.name for field in dataclasses.fields(type_))
+            return type_
+        return decorator
+
+    def encode(self, data: Any) -> bytes:
+        out = bytearray()
+        self.__write(out, data)
+        return bytes(out)
+
+    def decode(self, body: Buffer) -> Any:
+        data, _ = self.__read(body, 0)
+        return data
+
+    def __write(self, out: bytearray, value: Any) -> None:
+        type_ = type(value)
+        if value is None:
+            out.append(TAG_NONE)
+        elif type_ is bool:
+            out.append(TAG_TRUE if value else TAG_FALSE)
+        elif type_ is int:
+            out.append(TAG_INT)
+            write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif type_ is float:
+            out.append(TAG_FLOAT)
+            out += FLOAT.pack(value)
+        elif type_ is str:
+            encoded = value.encode('utf-8')
+            out.append(TAG_STR)
+            write_varint(out, len(encoded))
+            out += encoded
+        elif type_ is bytes or type_ is memoryview:
+            out.append(TAG_BYTES)
+            write_varint(out, len(value))
+            out += value
+        elif type_ is tuple or type_ is list:
+            out.append(TAG_TUPLE if type_ is tuple else TAG_LIST)
+            write_varint(out, len(value))
+            for item in value:
+                self.__write(out, item)
+        elif type_ is dict:
+            out.append(TAG_DICT)
+            write_varint(out, len(value))
+            for key, item in value.items():
+                self.__write(out, key)
+                self.__write(out, item)
+        elif type_ is UUID:
+            out.append(TAG_UUID)
+            out += value.bytes
+        elif type_ is datetime and value.tzinfo is None:
+            out.append(TAG_DATETIME)
+            write_varint(out, value.toordinal())
+            write_varint(out, ((value.hour * 60 + value.minute) * 60 + value.second)
+                         * 1_000_000 + value.microsecond)
+        elif type_ in self.__tags:
+            if isinstance(value, Enum):
+                out.append(TAG_ENUM)
+                write_varint(out, self.__tags[type_])
+                self.__write(out, value.value)
+            else:
+                out.append(TAG_DATACLASS)
+                write_varint(out, self.__tags[type_])
+                fields = self.__fields[type_]
+                write_varint(out, len(fields))
+                for field in fields:
+                    self.__write(out, getattr(value, field))
+        else:
+            pickled = dumps(value)
+            out.append(TAG_PICKLE)
+            write_varint(out, len(pickled))
+            out += pickled
+
+    def __read(self, body: Buffer, pos: int) -> Tuple[Any, int]:
+        tag = body[pos]
+        pos += 1
+        if tag == TAG_NONE:
+            return None, pos
+        if tag == TAG_FALSE:
+            return False, pos
+        if tag == TAG_TRUE:
+            return True, pos
+        if tag == TAG_INT:
+            value, pos = read_varint(body, pos)
+            return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+        if tag == TAG_FLOAT:
+            return FLOAT.unpack_from(body, pos)[0], pos + FLOAT.size
+        if tag == TAG_STR or tag == TAG_BYTES or tag == TAG_PICKLE:
+            length, pos = read_varint(body, pos)
+            chunk = bytes(body[pos:pos + length])
+            pos += length
+            if tag == TAG_STR:
+                return chunk.decode('utf-8'), pos
+            if tag == TAG_PICKLE:
+                return pickle.loads(chunk), pos
+            return chunk, pos
+        if tag == TAG_TUPLE or tag == TAG_LIST:
+            length, pos = read_varint(body, pos)
+            items: List[Any] = []
+            for _ in range(length):
+                item, pos = self.__read(body, pos)
+                items.append(item)
+            return (tuple(items) if tag == TAG_TUPLE else items), pos
+        if tag == TAG_DICT:
+            length, pos = read_varint(body, pos)
+            result = {}
+            for _ in range(length):
+                key, pos = self.__read(body, pos)
+                result[key], pos = self.__read(body, pos)
+            return result, pos
+        if tag == TAG_UUID:
+            return UUID(bytes=bytes(body[pos:pos + 16])), pos + 16
+        if tag == TAG_DATETIME:
+            days, pos = read_varint(body, pos)
+            microseconds, pos = read_varint(body, pos)
+            return datetime.fromordinal(days) + timedelta(microseconds=microseconds), pos
+        if tag == TAG_ENUM:
+            type_tag, pos = read_varint(body, pos)
+            value, pos = self.__read(body, pos)
+            return self.__type(type_tag)(value), pos
+        if tag == TAG_DATACLASS:
+            type_tag, pos = read_varint(body, pos)
+            length, pos = read_varint(body, pos)
+            values = []
+            for _ in range(length):
+                value, pos = self.__read(body, pos)
+                values.append(value)
+            return self.__type(type_tag)(*values), pos
+        raise ValueError(f'Unknown compact tag {tag}')
+
+    def __type(self, tag: int) -> type:
+        if tag not in self.__types:
+            raise ValueError(f'Unknown compact type tag {tag}')
+        return self.__types[tag]
+
+
+CODECS: Dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec) -> Codec:
+    if not 0 <= codec.id < 16:
+        raise ValueError(f'Codec id {codec.id} does not fit in the packet flags')
+    CODECS[codec.id] = codec
+    return codec
+
+
+PICKLE = register_codec(PickleCodec())
+COMPACT = register_codec(CompactCodec())
+compact_type = CompactCodec.register
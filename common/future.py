@@ -0,0 +1,30 @@
+from concurrent.futures import Future
+from typing import Any, Callable, TypeVar
+
+
+T = TypeVar('T')
+
+
+def resolved(result: Any) -> 'Future[Any]':
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+def failed(e: BaseException) -> 'Future[Any]':
+    future: Future = Future()
+    future.set_exception(e)
+    return future
+
+
+def then(future: 'Future[Any]', callback: Callable[[Any], T]) -> 'Future[T]':
+    chained: Future = Future()
+
+    def done(future: 'Future[Any]') -> None:
+        try:
+            chained.set_result(callback(future.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
@@ -1,9 +1,60 @@
 from dataclasses import dataclass, field
+from enum import Enum
 import pickle
 import socket
-from typing import Any
+import struct
+import threading
+from typing import Any, List, Tuple
 from uuid import UUID, uuid4
 
+from .codec import CODECS, PICKLE, Buffer, Codec, dumps
+
+
+class Framing(Enum):
+    Legacy = 0
+    Binary = 1
+
+
+@dataclass
+class Negotiation:
+    framings: Tuple[Framing, ...]
+    codecs: Tuple[int, ...] = ()
+
+
+# length, flags, message id
+HEADER = struct.Struct('!IB16s')
+LEGACY_HEADER_SIZE = 10
+
+FLAG_ERROR = 0x01
+FLAG_EXIT = 0x02
+FLAG_RAW = 0x04
+CODEC_SHIFT = 4
+
+INITIAL_BUFFER_SIZE = 64 * 1024
+
+
+def recv_exactly(sock: socket.socket, view: memoryview) -> None:
+    while view:
+        received = sock.recv_into(view)
+        if received == 0:
+            raise ConnectionError('connection closed by peer')
+        view = view[received:]
+
+
+def send_buffers(sock: socket.socket, buffers: List[Buffer]) -> None:
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
 
 @dataclass
 class Packet:
@@ -14,14 +65,76 @@ class Packet:
 
     @staticmethod
     def read_from(sock: socket.socket) -> 'Packet':
-        length = int(sock.recv(10).decode('utf-8'))
-        pickled = sock.recv(length)
-        while len(pickled) < length:
-            pickled += sock.recv(length - len(pickled))
+        header = bytearray(LEGACY_HEADER_SIZE)
+        recv_exactly(sock, memoryview(header))
+        pickled = bytearray(int(header))
+        recv_exactly(sock, memoryview(pickled))
         return pickle.loads(pickled)
 
     def send_to(self, sock: socket.socket) -> None:
-        pickled = pickle.dumps(self)
-        length = len(pickled)
-        sock.sendall(f'{length:<10}'.encode('utf-8'))
-        sock.sendall(pickled)
+        send_buffers(sock, self.encode_legacy())
+
+    def encode_legacy(self) -> List[bytes]:
+        pickled = dumps(self)
+        return [f'{len(pickled):<10}'.encode('utf-8'), pickled]
+
+    def encode(self, codec: Codec = PICKLE) -> List[Buffer]:
+        flags = 0
+        if self.is_error:
+            flags |= FLAG_ERROR
+        if self.is_exit:
+            flags |= FLAG_EXIT
+        if isinstance(self.data, (bytes, memoryview)):
+            flags |= FLAG_RAW
+            body = self.data
+        else:
+            flags |= codec.id << CODEC_SHIFT
+            body = codec.encode(self.data)
+        return [HEADER.pack(len(body), flags, self.message_id.bytes), body]
+
+    @staticmethod
+    def decode(flags: int, message_id: bytes, body: Buffer) -> 'Packet':
+        if flags & FLAG_RAW:
+            data = bytes(body)
+        else:
+            codec_id = flags >> CODEC_SHIFT
+            if codec_id not in CODECS:
+                raise ValueError(f'Unknown codec {codec_id}')
+            data = CODECS[codec_id].decode(body)
+        return Packet(data, UUID(bytes=message_id),
+                      is_error=bool(flags & FLAG_ERROR),
+                      is_exit=bool(flags & FLAG_EXIT))
+
+
+class PacketChannel:
+
+    def __init__(self, sock: socket.socket, framing: Framing = Framing.Legacy,
+                 codec: Codec = PICKLE) -> None:
+        self.sock = sock
+        self.framing = framing
+        self.codec = codec
+        self.__write_lock = threading.Lock()
+        self.__header = bytearray(HEADER.size)
+        self.__buffer = bytearray(INITIAL_BUFFER_SIZE)
+
+    def read(self) -> Packet:
+        if self.framing == Framing.Legacy:
+            return Packet.read_from(self.sock)
+        recv_exactly(self.sock, memoryview(self.__header))
+        length, flags, message_id = HEADER.unpack(self.__header)
+        if length > len(self.__buffer):
+            self.__buffer = bytearray(max(length, 2 * len(self.__buffer)))
+        body = memoryview(self.__buffer)[:length]
+        recv_exactly(self.sock, body)
+        return Packet.decode(flags, message_id, body)
+
+    def send(self, packet: Packet) -> None:
+        if self.framing == Framing.Legacy:
+            buffers = packet.encode_legacy()
+        else:
+            buffers = packet.encode(self.codec)
+        with self.__write_lock:
+            send_buffers(self.sock, buffers)
+
+    def push(self, packet: Packet) -> None:
+        self.send(packet)
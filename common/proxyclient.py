@@ -1,8 +1,15 @@
+
+from .codec import COMPACT, Codec
+from .packet import Framing
 from .tcpclient import TCPClient
 
 
 class ProxyClient(TCPClient):
 
-    def __init__(self, host: str, proxy_port: int, actual_port: int) -> None:
-        super().__init__(host, proxy_port)
-        self.sock.send(f'{actual_port}\n'.encode('utf-8'))
+    def __init__(self, host: str, proxy_port: int, actual_port: int,
+                 framing: Framing = Framing.Binary, codec: Codec = COMPACT) -> None:
+        self.actual_port = actual_port
+        super().__init__(host, proxy_port, framing, codec)
+
+    def handshake(self) -> None:
+        self.sock.send(f'{self.actual_port}\n'.encode('utf-8'))
@@ -2,12 +2,13 @@
 
 import socket
 import threading
-from typing import Dict, Generic
+from typing import Any, Callable, Dict, Generic
 from uuid import UUID
 import warnings
 
 from client.firewall import Firewall
-from .packet import Packet
+from .codec import CODECS, COMPACT, Codec
+from .packet import Framing, Negotiation, Packet, PacketChannel
 from .tcpserver import TRequest, TResponse
 
 
@@ -23,7 +24,7 @@ class Promise(Generic[TResponse]):
 
     def wait(self) -> TResponse:
         with self.__condition:
-            self.__condition.wait()
+            self.__condition.wait_for(lambda: self.__packet is not None)
             if self.__packet.is_error:
                 raise self.__packet.data
             return self.__packet.data
@@ -31,35 +32,68 @@ class Promise(Generic[TResponse]):
 
 class TCPClient(Generic[TRequest, TResponse]):
 
-    def __init__(self, host: str, port: int) -> None:
+    def __init__(self, host: str, port: int, framing: Framing = Framing.Binary,
+                 codec: Codec = COMPACT) -> None:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((host, port))
+        self.handshake()
+        self.channel = PacketChannel(self.sock)
+        if framing != Framing.Legacy:
+            self.__negotiate(framing, codec)
         self.requests: Dict[UUID, Promise] = {}
+        self.subscriptions: Dict[UUID, Callable[[Any], None]] = {}
         self.lock = threading.Lock()
         self.read_thread = threading.Thread(target=self.__read)
         self.read_thread.start()
         print(self.sock.getpeername())
 
+    def handshake(self) -> None:
+        pass
+
+    def __negotiate(self, framing: Framing, codec: Codec) -> None:
+        self.channel.send(Packet(Negotiation((framing,), (codec.id,))))
+        reply = self.channel.read()
+        if reply.is_error or not isinstance(reply.data, Negotiation):
+            return
+        if framing in reply.data.framings:
+            self.channel.framing = framing
+        if reply.data.codecs and reply.data.codecs[0] in CODECS:
+            self.channel.codec = CODECS[reply.data.codecs[0]]
+
     def __read(self) -> None:
         while True:
-            packet = Packet.read_from(self.sock)
+            packet = self.channel.read()
             with self.lock:
+                subscriber = self.subscriptions.get(packet.message_id)
                 if packet.message_id in self.requests:
                     self.requests[packet.message_id].notify(packet)
                     del self.requests[packet.message_id]
                     if packet.is_exit:
                         break
-                else:
+                elif subscriber is None:
                     warnings.warn(f'unexpected packet {packet.message_id}')
+            if subscriber is not None:
+                subscriber(packet.data)
+
+    def subscribe(self, subscription_id: UUID, callback: Callable[[Any], None]) -> None:
+        with self.lock:
+            self.subscriptions[subscription_id] = callback
+
+    def unsubscribe(self, subscription_id: UUID) -> None:
+        with self.lock:
+            self.subscriptions.pop(subscription_id, None)
 
-    @Firewall.filter_packet
     def ask(self, request: TRequest) -> TResponse:
+        return self.ask_async(request).wait()
+
+    @Firewall.filter_packet
+    def ask_async(self, request: TRequest) -> Promise[TResponse]:
         packet = Packet(request)
         promise = Promise()
         with self.lock:
             self.requests[packet.message_id] = promise
-        packet.send_to(self.sock)
-        return promise.wait()
+        self.channel.send(packet)
+        return promise
 
     @Firewall.filter_packet
     def exit(self) -> None:
@@ -67,7 +101,7 @@ class TCPClient(Generic[TRequest, TResponse]):
         promise = Promise()
         with self.lock:
             self.requests[packet.message_id] = promise
-        packet.send_to(self.sock)
+        self.channel.send(packet)
         promise.wait()
         self.read_thread.join()
         self.sock.close()
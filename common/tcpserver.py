@@ -1,13 +1,17 @@
 from abc import ABC, abstractmethod
-from ast import Dict
+from concurrent.futures import Future
+from functools import partial
 import socket
 import threading
 import time
 import traceback
-from typing import Generic, TypeVar
+from typing import Dict, Generic, Optional, Tuple, TypeVar
 from uuid import UUID, uuid4
 
-from .packet import Packet
+from .codec import CODECS, COMPACT, PICKLE, Codec
+from .future import failed, resolved
+from .packet import Framing, Negotiation, Packet, PacketChannel
+from .workerpool import WorkerPool, WorkerPoolStats
 
 
 TRequest = TypeVar('TRequest')
@@ -16,11 +20,19 @@ TResponse = TypeVar('TResponse')
 
 class TCPServer(Generic[TRequest, TResponse], ABC):
 
-    def __init__(self, port: int) -> None:
+    def __init__(self, port: int,
+                 workers: int = 32,
+                 queue_size: int = 64,
+                 ordered: bool = True,
+                 framings: Tuple[Framing, ...] = (Framing.Binary, Framing.Legacy),
+                 codecs: Tuple[Codec, ...] = (COMPACT, PICKLE)) -> None:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.bind(('', port))
         self.lock = threading.Lock()
-        self.exit_clients: Dict[UUID, bool] = {}
+        self.pool: WorkerPool[UUID] = WorkerPool(workers, queue_size, ordered)
+        self.connections: Dict[UUID, PacketChannel] = {}
+        self.framings = framings
+        self.codecs = codecs
 
     def listen(self) -> None:
         try:
@@ -34,40 +46,106 @@ class TCPServer(Generic[TRequest, TResponse], ABC):
             time.sleep(10)
             self.sock.close()
 
-    def __request_job(self, packet: Packet, client: socket.socket, client_id: UUID) -> None:
-            if packet.is_exit:
-                Packet(None, packet.message_id, is_exit=True).send_to(client)
-                with self.lock:
-                    self.exit_clients[client_id] = True
-            try:
-                response = self.handle_request(client_id, packet.data)
-                packet = Packet(response, packet.message_id)
-            except Exception as e:
-                packet = Packet(e, packet.message_id, is_error=True)
-                print(traceback.format_exc())
-            # print(f'packet {packet.message_id} is being sent')
-            packet.send_to(client)
-            # print(f'packet {packet.message_id} sent')
+    def negotiate(self, offer: Negotiation) -> Negotiation:
+        framing = next((framing for framing in self.framings
+                        if framing in offer.framings), Framing.Legacy)
+        codec = next((codec for codec in self.codecs
+                      if codec.id in offer.codecs), PICKLE)
+        return Negotiation((framing,), (codec.id,))
 
+    def respond(self, client_id: UUID, packet: Packet) -> 'Future[Packet]':
+        responded: Future = Future()
+
+        def done(response: Future) -> None:
+            e = response.exception()
+            if e is not None:
+                print(''.join(traceback.format_exception(e)))
+                responded.set_result(Packet(e, packet.message_id, is_error=True))
+            else:
+                responded.set_result(Packet(response.result(), packet.message_id))
+
+        try:
+            response = self.handle_request(client_id, packet.data)
+        except Exception as e:
+            response = failed(e)
+        if not isinstance(response, Future):
+            response = resolved(response)
+        response.add_done_callback(done)
+        return responded
+
+    def push(self, client_id: UUID, packet: Packet) -> bool:
+        with self.lock:
+            channel = self.connections.get(client_id)
+        if channel is None:
+            return False
+        try:
+            channel.push(packet)
+        except OSError:
+            return False
+        return True
+
+    def handle_disconnect(self, client_id: UUID) -> None:
+        pass
+
+    def metrics(self) -> WorkerPoolStats:
+        return self.pool.stats()
+
+    def queue_depths(self) -> Dict[UUID, int]:
+        return self.pool.queue_depths()
+
+    def __request_job(self, packet: Packet, channel: PacketChannel,
+                      client_id: UUID) -> Optional['Future[Packet]']:
+        if packet.is_exit:
+            self.__send(channel, Packet(None, packet.message_id, is_exit=True))
+            return None
+        responded = self.respond(client_id, packet)
+        responded.add_done_callback(lambda responded: self.__send(channel, responded.result()))
+        return responded
+
+    def __send(self, channel: PacketChannel, packet: Packet) -> None:
+        # print(f'packet {packet.message_id} is being sent')
+        try:
+            channel.send(packet)
+        except ConnectionError:
+            return
+        except Exception as e:
+            print(traceback.format_exc())
+            if packet.is_error:
+                return
+            self.__send(channel, Packet(e, packet.message_id, is_error=True))
+            return
+        # print(f'packet {packet.message_id} sent')
 
     def __handle_client(self, client: socket.socket) -> None:
         client_id = uuid4()
+        peer = client.getpeername()
+        channel = PacketChannel(client)
+        self.pool.open(client_id)
         with self.lock:
-            self.exit_clients[client_id] = False
-        while True:
-            packet = Packet.read_from(client)
-            # print(f'packet {packet.message_id} received')
-            with self.lock:
-                if self.exit_clients[client_id]:
+            self.connections[client_id] = channel
+        try:
+            while True:
+                packet = channel.read()
+                # print(f'packet {packet.message_id} received')
+                if isinstance(packet.data, Negotiation):
+                    negotiation = self.negotiate(packet.data)
+                    channel.send(Packet(negotiation, packet.message_id))
+                    channel.framing = negotiation.framings[0]
+                    channel.codec = CODECS[negotiation.codecs[0]]
+                    continue
+                self.pool.submit(client_id, partial(self.__request_job,
+                                                    packet, channel, client_id))
+                if packet.is_exit:
                     break
-            threading.Thread(target=self.__request_job,
-                            args=(packet, client, client_id),
-                            daemon=True).start()
-        with self.lock:
-            del self.exit_clients[client_id]
-        print(f'closing connection from {client.getpeername()}')
-        time.sleep(1)
-        client.close()
+        except ConnectionError:
+            pass
+        finally:
+            self.pool.close(client_id)
+            with self.lock:
+                del self.connections[client_id]
+            self.handle_disconnect(client_id)
+            print(f'closing connection from {peer}')
+            client.close()
 
     @abstractmethod
     def handle_request(self, client_id: UUID, request: TRequest) -> TResponse:
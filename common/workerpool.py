@@ -0,0 +1,115 @@
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+import threading
+import traceback
+from typing import Any, Callable, Deque, Dict, Generic, Hashable, List, TypeVar
+
+
+TKey = TypeVar('TKey', bound=Hashable)
+
+
+@dataclass
+class WorkerPoolStats:
+    workers: int
+    busy_workers: int
+    queues: int
+    queued: int
+    max_queue_depth: int
+    completed: int
+
+
+class WorkerQueue:
+
+    def __init__(self) -> None:
+        self.jobs: Deque[Callable[[], Any]] = deque()
+        self.running = 0
+        self.scheduled = False
+
+
+class WorkerPool(Generic[TKey]):
+
+    def __init__(self, workers: int, queue_size: int, ordered: bool = True) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ordered = ordered
+        self.__lock = threading.Lock()
+        self.__ready = threading.Condition(self.__lock)
+        self.__changed = threading.Condition(self.__lock)
+        self.__queues: Dict[TKey, WorkerQueue] = {}
+        self.__schedule: Deque[TKey] = deque()
+        self.__busy = 0
+        self.__completed = 0
+        self.__threads: List[threading.Thread] = []
+
+    def open(self, key: TKey) -> None:
+        with self.__lock:
+            if not self.__threads:
+                self.__threads = [threading.Thread(target=self.__work, daemon=True)
+                                  for _ in range(self.workers)]
+                for thread in self.__threads:
+                    thread.start()
+            self.__queues[key] = WorkerQueue()
+
+    def close(self, key: TKey) -> None:
+        with self.__lock:
+            queue = self.__queues[key]
+            self.__changed.wait_for(lambda: not queue.jobs and not queue.running)
+            del self.__queues[key]
+
+    def submit(self, key: TKey, job: Callable[[], Any]) -> None:
+        with self.__lock:
+            queue = self.__queues[key]
+            self.__changed.wait_for(lambda: len(queue.jobs) < self.queue_size)
+            queue.jobs.append(job)
+            self.__wake(key, queue)
+
+    def queue_depths(self) -> Dict[TKey, int]:
+        with self.__lock:
+            return {key: len(queue.jobs) + queue.running
+                    for key, queue in self.__queues.items()}
+
+    def stats(self) -> WorkerPoolStats:
+        with self.__lock:
+            depths = [len(queue.jobs) for queue in self.__queues.values()]
+            return WorkerPoolStats(self.workers, self.__busy, len(depths),
+                                   sum(depths), max(depths, default=0),
+                                   self.__completed)
+
+    def __wake(self, key: TKey, queue: WorkerQueue) -> None:
+        if queue.scheduled or not queue.jobs or (self.ordered and queue.running):
+            return
+        queue.scheduled = True
+        self.__schedule.append(key)
+        self.__ready.notify()
+
+    def __work(self) -> None:
+        while True:
+            with self.__lock:
+                self.__ready.wait_for(lambda: self.__schedule)
+                key = self.__schedule.popleft()
+                queue = self.__queues[key]
+                queue.scheduled = False
+                job = queue.jobs.popleft()
+                queue.running += 1
+                self.__busy += 1
+                self.__wake(key, queue)
+                self.__changed.notify_all()
+            result = None
+            try:
+                result = job()
+            except Exception:
+                print(traceback.format_exc())
+            with self.__lock:
+                self.__busy -= 1
+            if isinstance(result, Future):
+                result.add_done_callback(lambda _, key=key, queue=queue: self.__finish(key, queue))
+            else:
+                self.__finish(key, queue)
+
+    def __finish(self, key: TKey, queue: WorkerQueue) -> None:
+        with self.__lock:
+            queue.running -= 1
+            self.__completed += 1
+            self.__wake(key, queue)
+            self.__changed.notify_all()
@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+import time
+from typing import List, Tuple
+
+from common.codec import compact_type
+from .framecache import Encoding
+
+
+ADAPT_INTERVAL = 2.0
+LAGGING_RATIO = 0.9
+RECOVERY_INTERVALS = 3
+
+# (scale, maximum JPEG quality), from best to worst
+LEVELS: List[Tuple[float, int]] = [(1.0, 100),
+                                   (1.0, 75),
+                                   (0.75, 70),
+                                   (0.5, 60),
+                                   (0.5, 40),
+                                   (0.25, 40)]
+
+
+@compact_type(36)
+@dataclass
+class StreamParams:
+    width: int = 0
+    height: int = 0
+    quality: int = 95
+    max_bitrate: int = 0
+    adaptive: bool = True
+
+    @property
+    def encoding(self) -> Encoding:
+        return Encoding(max(self.width, 0), max(self.height, 0), min(max(self.quality, 1), 100))
+
+
+class QualityController:
+
+    def __init__(self, params: StreamParams, size: Tuple[int, int], fps: float) -> None:
+        self.params = params
+        self.fps = fps
+        width, height = size
+        scale = min(params.width / width if params.width > 0 and width else 1,
+                    params.height / height if params.height > 0 and height else 1, 1)
+        self.__size = (width * scale, height * scale)
+        self.level = 0
+        self.encoding = self.__encoding(0)
+        self.__frames = 0
+        self.__bytes = 0
+        self.__good_intervals = 0
+        self.__interval_start = time.monotonic()
+
+    def __encoding(self, level: int) -> Encoding:
+        encoding = self.params.encoding
+        if level == 0:
+            return encoding
+        scale, max_quality = LEVELS[level]
+        width, height = self.__size
+        return Encoding(max(round(width * scale), 1), max(round(height * scale), 1),
+                        min(encoding.quality, max_quality))
+
+    def record(self, frames: int, size: int) -> None:
+        self.__frames += frames
+        self.__bytes += size
+        now = time.monotonic()
+        elapsed = now - self.__interval_start
+        if elapsed < ADAPT_INTERVAL:
+            return
+        rate = self.__frames / elapsed
+        bitrate = 8 * self.__bytes / self.__frames * self.fps if self.__frames else 0
+        self.__frames = 0
+        self.__bytes = 0
+        self.__interval_start = now
+        if not self.params.adaptive or self.fps <= 0:
+            return
+        lagging = rate < LAGGING_RATIO * self.fps
+        if lagging or 0 < self.params.max_bitrate < bitrate:
+            self.__good_intervals = 0
+            self.__set_level(self.level + 1)
+            return
+        self.__good_intervals += 1
+        if self.__good_intervals >= RECOVERY_INTERVALS:
+            self.__good_intervals = 0
+            self.__set_level(self.level - 1)
+
+    def __set_level(self, level: int) -> None:
+        level = min(max(level, 0), len(LEVELS) - 1)
+        if level != self.level:
+            self.level = level
+            self.encoding = self.__encoding(level)
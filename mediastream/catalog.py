@@ -0,0 +1,171 @@
+from dataclasses import asdict, dataclass
+from fnmatch import fnmatch
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import cv2
+
+from common.codec import compact_type
+
+
+CATALOG_VERSION = 1
+RESCAN_INTERVAL = 5.0
+
+VIDEO_EXTENSIONS = set(['mp4', 'avi',
+                        'mkv', 'mov',
+                        'flv', 'wmv',
+                        'mpg', 'mpeg',
+                        'm4v', '3gp',
+                        '3g2'])
+
+
+@compact_type(37)
+@dataclass
+class MediaInfo:
+    name: str
+    fps: float
+    frames: int
+    width: int
+    height: int
+    duration: float
+    size: int
+    mtime: int
+
+
+@compact_type(38)
+@dataclass
+class MediaList:
+    total: int
+    items: List[MediaInfo]
+
+
+def probe(path: str, name: str, stat: os.stat_result) -> MediaInfo:
+    video = cv2.VideoCapture(path)
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frames = max(int(video.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        video.release()
+    return MediaInfo(name, fps, frames, width, height, frames / fps if fps > 0 else 0.0,
+                     stat.st_size, stat.st_mtime_ns)
+
+
+class Catalog:
+
+    def __init__(self, root_directory: str, cache_path: Optional[str] = None,
+                 rescan_interval: float = RESCAN_INTERVAL) -> None:
+        self.root_directory = root_directory
+        self.cache_path = cache_path
+        self.rescan_interval = rescan_interval
+        self.__lock = threading.Lock()
+        self.__entries: Dict[str, MediaInfo] = self.__load()
+        self.__names: List[str] = sorted(self.__entries)
+        self.__listeners: List[Callable[[List[str]], None]] = []
+        self.__stopped = threading.Event()
+        self.__scanning_thread: Optional[threading.Thread] = None
+        self.scan()
+
+    def __load(self) -> Dict[str, MediaInfo]:
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path) as cache_file:
+                cache = json.load(cache_file)
+            if cache['version'] != CATALOG_VERSION:
+                return {}
+            return {name: MediaInfo(**info) for name, info in cache['files'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def __save(self, entries: Dict[str, MediaInfo]) -> None:
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        with open(f'{self.cache_path}.tmp', 'w') as cache_file:
+            json.dump({'version': CATALOG_VERSION,
+                       'files': {name: asdict(info) for name, info in entries.items()}},
+                      cache_file)
+        os.replace(f'{self.cache_path}.tmp', self.cache_path)
+
+    def scan(self) -> List[str]:
+        with self.__lock:
+            entries = dict(self.__entries)
+        changed: List[str] = []
+        found = set()
+        with os.scandir(self.root_directory) as scanner:
+            for entry in scanner:
+                if entry.name.split('.')[-1] not in VIDEO_EXTENSIONS or not entry.is_file():
+                    continue
+                found.add(entry.name)
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                info = entries.get(entry.name)
+                if info is not None and info.mtime == stat.st_mtime_ns \
+                        and info.size == stat.st_size:
+                    continue
+                entries[entry.name] = probe(entry.path, entry.name, stat)
+                changed.append(entry.name)
+        removed = set(entries) - found
+        for name in removed:
+            del entries[name]
+        if changed or removed:
+            with self.__lock:
+                self.__entries = entries
+                self.__names = sorted(entries)
+                listeners = list(self.__listeners)
+            self.__save(entries)
+            if changed:
+                for listener in listeners:
+                    listener([os.path.join(self.root_directory, name) for name in changed])
+        return changed
+
+    def subscribe(self, listener: Callable[[List[str]], None]) -> None:
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def __contains__(self, name: str) -> bool:
+        with self.__lock:
+            return name in self.__entries
+
+    def get(self, name: str) -> Optional[MediaInfo]:
+        with self.__lock:
+            return self.__entries.get(name)
+
+    def names(self) -> List[str]:
+        with self.__lock:
+            return list(self.__names)
+
+    def list(self, offset: int = 0, limit: int = 0, filter: str = '') -> MediaList:
+        with self.__lock:
+            names = self.__names
+            if filter:
+                pattern = filter.lower()
+                if not any(char in pattern for char in '*?['):
+                    pattern = f'*{pattern}*'
+                names = [name for name in names if fnmatch(name.lower(), pattern)]
+            page = names[offset:offset + limit] if limit > 0 else names[offset:]
+            return MediaList(len(names), [self.__entries[name] for name in page])
+
+    def __rescan(self) -> None:
+        while not self.__stopped.wait(self.rescan_interval):
+            try:
+                self.scan()
+            except OSError as e:
+                print(f'catalog rescan failed: {e}')
+
+    def start(self) -> None:
+        if self.__scanning_thread is not None:
+            return
+        self.__scanning_thread = threading.Thread(target=self.__rescan, daemon=True)
+        self.__scanning_thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__scanning_thread is not None:
+            self.__scanning_thread.join()
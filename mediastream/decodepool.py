@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+import heapq
+import itertools
+import os
+import threading
+import traceback
+from typing import Callable, List, Tuple
+
+
+DEFAULT_DECODE_WORKERS = os.cpu_count() or 4
+DEFAULT_BUFFER_BUDGET = 64 * 1024 * 1024
+
+
+class DecodePoolFullError(Exception):
+    pass
+
+
+@dataclass
+class DecodePoolStats:
+    workers: int
+    busy_workers: int
+    streams: int
+    max_streams: int
+    ready: int
+    completed: int
+    buffered_bytes: int
+    max_buffered_bytes: int
+
+
+class DecodePool:
+
+    def __init__(self, workers: int = DEFAULT_DECODE_WORKERS, max_streams: int = 0,
+                 max_buffered_bytes: int = DEFAULT_BUFFER_BUDGET) -> None:
+        self.workers = workers
+        self.max_streams = max_streams
+        self.max_buffered_bytes = max_buffered_bytes
+        self.__buffered_bytes = 0
+        self.__lock = threading.Lock()
+        self.__ready = threading.Condition(self.__lock)
+        self.__jobs: List[Tuple[float, int, Callable[[], None]]] = []
+        self.__order = itertools.count()
+        self.__streams = 0
+        self.__busy = 0
+        self.__completed = 0
+        self.__threads: List[threading.Thread] = []
+
+    def admit(self) -> None:
+        with self.__lock:
+            if 0 < self.max_streams <= self.__streams:
+                raise DecodePoolFullError(f'{self.__streams} streams are already playing')
+            self.__streams += 1
+            if not self.__threads:
+                self.__threads = [threading.Thread(target=self.__work, daemon=True)
+                                  for _ in range(self.workers)]
+                for thread in self.__threads:
+                    thread.start()
+
+    def leave(self) -> None:
+        with self.__lock:
+            self.__streams -= 1
+
+    def buffer(self, size: int) -> None:
+        with self.__lock:
+            self.__buffered_bytes += size
+
+    @property
+    def over_budget(self) -> bool:
+        with self.__lock:
+            return 0 < self.max_buffered_bytes <= self.__buffered_bytes
+
+    def submit(self, deadline: float, job: Callable[[], None]) -> None:
+        with self.__lock:
+            heapq.heappush(self.__jobs, (deadline, next(self.__order), job))
+            self.__ready.notify()
+
+    def stats(self) -> DecodePoolStats:
+        with self.__lock:
+            return DecodePoolStats(self.workers, self.__busy, self.__streams,
+                                   self.max_streams, len(self.__jobs), self.__completed,
+                                   self.__buffered_bytes, self.max_buffered_bytes)
+
+    def __work(self) -> None:
+        while True:
+            with self.__lock:
+                self.__ready.wait_for(lambda: self.__jobs)
+                _, _, job = heapq.heappop(self.__jobs)
+                self.__busy += 1
+            try:
+                job()
+            except Exception:
+                print(traceback.format_exc())
+            with self.__lock:
+                self.__busy -= 1
+                self.__completed += 1
@@ -0,0 +1,249 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from common.codec import Buffer, compact_type
+
+if TYPE_CHECKING:
+    from .frameindex import FrameIndex, FrameIndexStore
+    from .segmentstore import Segment, SegmentStore
+
+
+MAX_SKIP = 64
+MAX_DECODERS = 4
+
+
+@dataclass(frozen=True)
+class Encoding:
+    width: int = 0
+    height: int = 0
+    quality: int = 95
+
+    def encode(self, frame: np.ndarray) -> Optional[bytes]:
+        height, width = frame.shape[:2]
+        scale = min(self.width / width if self.width else 1,
+                    self.height / height if self.height else 1)
+        if scale < 1:
+            frame = cv2.resize(frame, (max(round(width * scale), 1),
+                                       max(round(height * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+        ret, frame = cv2.imencode('.jpg', frame, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+        return frame.tobytes() if ret else None
+
+
+SOURCE_ENCODING = Encoding()
+
+FrameKey = Tuple[str, int, Encoding]
+
+
+@compact_type(35)
+@dataclass
+class FrameCacheStats:
+    hits: int
+    misses: int
+    frames: int
+    bytes: int
+    max_bytes: int
+    sources: int = 0
+    decoders: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class FrameCache:
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__frames: 'OrderedDict[FrameKey, bytes]' = OrderedDict()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: FrameKey) -> Optional[bytes]:
+        with self.__lock:
+            frame = self.__frames.get(key)
+            if frame is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+            self.__frames.move_to_end(key)
+            return frame
+
+    def put(self, key: FrameKey, frame: bytes) -> None:
+        if len(frame) > self.max_bytes:
+            return
+        with self.__lock:
+            old = self.__frames.pop(key, None)
+            if old is not None:
+                self.__bytes -= len(old)
+            self.__frames[key] = frame
+            self.__bytes += len(frame)
+            while self.__bytes > self.max_bytes:
+                _, evicted = self.__frames.popitem(last=False)
+                self.__bytes -= len(evicted)
+
+    def stats(self) -> FrameCacheStats:
+        with self.__lock:
+            return FrameCacheStats(self.__hits, self.__misses, len(self.__frames),
+                                   self.__bytes, self.max_bytes)
+
+
+class Decoder:
+
+    def __init__(self, path: str, encoding: Encoding, position: int = 0,
+                 keyframe: Optional[int] = None) -> None:
+        self.__video = cv2.VideoCapture(path)
+        start = position if keyframe is None else keyframe
+        if start:
+            self.__video.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for _ in range(position - start):
+            self.__video.grab()
+        self.encoding = encoding
+        self.position = position
+        self.last_used = time.monotonic()
+
+    @property
+    def fps(self) -> float:
+        return self.__video.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return (int(self.__video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.__video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def read(self) -> Optional[bytes]:
+        self.last_used = time.monotonic()
+        ret, frame = self.__video.read()
+        if not ret:
+            return None
+        self.position += 1
+        return self.encoding.encode(frame) or b''
+
+    def release(self) -> None:
+        self.__video.release()
+
+
+class FrameSource:
+
+    def __init__(self, path: str, cache: FrameCache, encoding: Encoding = SOURCE_ENCODING,
+                 segment: Optional['Segment'] = None, position: int = 0,
+                 index: Optional['FrameIndex'] = None) -> None:
+        self.path = path
+        self.encoding = encoding
+        self.cache = cache
+        self.segment = segment
+        self.index = index
+        self.length: Optional[int] = None
+        self.readers = 0
+        self.__lock = threading.Lock()
+        self.__decoders: List[Decoder] = []
+        if segment is not None:
+            self.fps = segment.fps
+            self.size = segment.size
+        else:
+            self.__decoders.append(Decoder(path, encoding, position, self.__keyframe(position)))
+            self.fps = self.__decoders[0].fps
+            self.size = self.__decoders[0].size
+
+    def frame(self, index: int) -> Optional[Buffer]:
+        if self.segment is not None:
+            return self.segment.frame(index)
+        key = (self.path, index, self.encoding)
+        with self.__lock:
+            frame = self.cache.get(key)
+            if frame is not None:
+                return frame
+            if self.length is not None and index >= self.length:
+                return None
+            decoder = self.__decoder(index)
+            while decoder.position <= index:
+                position = decoder.position
+                frame = decoder.read()
+                if frame is None:
+                    self.length = position
+                    return None
+                self.cache.put((self.path, position, self.encoding), frame)
+            return frame
+
+    def __decoder(self, index: int) -> Decoder:
+        behind = [decoder for decoder in self.__decoders
+                  if 0 <= index - decoder.position <= MAX_SKIP]
+        if behind:
+            return max(behind, key=lambda decoder: decoder.position)
+        if len(self.__decoders) >= MAX_DECODERS:
+            idle = min(self.__decoders, key=lambda decoder: decoder.last_used)
+            self.__decoders.remove(idle)
+            idle.release()
+        decoder = Decoder(self.path, self.encoding, index, self.__keyframe(index))
+        self.__decoders.append(decoder)
+        return decoder
+
+    def __keyframe(self, index: int) -> Optional[int]:
+        return self.index.keyframe(index) if self.index is not None else None
+
+    @property
+    def decoders(self) -> int:
+        with self.__lock:
+            return len(self.__decoders)
+
+    def close(self) -> None:
+        with self.__lock:
+            for decoder in self.__decoders:
+                decoder.release()
+            self.__decoders.clear()
+
+
+class FrameSources:
+
+    def __init__(self, cache: FrameCache, store: Optional['SegmentStore'] = None,
+                 indexes: Optional['FrameIndexStore'] = None) -> None:
+        self.cache = cache
+        self.store = store
+        self.indexes = indexes
+        self.__lock = threading.Lock()
+        self.__sources: Dict[Tuple[str, Encoding], FrameSource] = {}
+
+    def acquire(self, path: str, encoding: Encoding = SOURCE_ENCODING,
+                position: int = 0) -> FrameSource:
+        with self.__lock:
+            source = self.__sources.get((path, encoding))
+            if source is not None:
+                source.readers += 1
+                return source
+        segment = index = None
+        if self.store is not None and self.store.encoding == encoding:
+            segment = self.store.open(path)
+        if segment is None and self.indexes is not None:
+            index = self.indexes.get(path)
+        with self.__lock:
+            source = self.__sources.get((path, encoding))
+            if source is None:
+                source = self.__sources[(path, encoding)] = FrameSource(
+                    path, self.cache, encoding, segment, position, index)
+            source.readers += 1
+            return source
+
+    def release(self, source: FrameSource) -> None:
+        with self.__lock:
+            source.readers -= 1
+            if source.readers:
+                return
+            del self.__sources[(source.path, source.encoding)]
+        source.close()
+
+    def stats(self) -> FrameCacheStats:
+        stats = self.cache.stats()
+        with self.__lock:
+            sources = list(self.__sources.values())
+        stats.sources = len(sources)
+        stats.decoders = sum(source.decoders for source in sources)
+        return stats
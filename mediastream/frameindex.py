@@ -0,0 +1,137 @@
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# magic, version, frames, keyframes, source mtime, source size
+INDEX_HEADER = struct.Struct('<4sHQQQQ')
+INDEX_MAGIC = b'MJFX'
+INDEX_VERSION = 1
+
+
+class FrameIndex:
+
+    def __init__(self, timestamps: np.ndarray, keyframes: np.ndarray) -> None:
+        self.timestamps = timestamps
+        self.keyframes = keyframes
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def duration(self) -> float:
+        return float(self.timestamps[-1]) if len(self) else 0.0
+
+    def frame_at(self, seconds: float) -> int:
+        index = int(np.searchsorted(self.timestamps, seconds, side='right')) - 1
+        return min(max(index, 0), max(len(self) - 1, 0))
+
+    def timestamp(self, index: int) -> float:
+        if not len(self):
+            return 0.0
+        return float(self.timestamps[min(max(index, 0), len(self) - 1)])
+
+    def keyframe(self, index: int) -> int:
+        if not len(self.keyframes):
+            return index
+        position = int(np.searchsorted(self.keyframes, index, side='right')) - 1
+        return int(self.keyframes[position]) if position >= 0 else 0
+
+    @staticmethod
+    def build(path: str) -> 'FrameIndex':
+        video = cv2.VideoCapture(path, cv2.CAP_FFMPEG, (cv2.CAP_PROP_FORMAT, -1))
+        try:
+            fps = video.get(cv2.CAP_PROP_FPS)
+            timestamps: List[float] = []
+            keyframes: List[int] = []
+            while video.grab():
+                timestamp = video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                if fps > 0 and (timestamp < 0 or timestamps and timestamp < timestamps[-1]):
+                    timestamp = len(timestamps) / fps
+                if video.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(len(timestamps))
+                timestamps.append(timestamp)
+        finally:
+            video.release()
+        if not timestamps:
+            return FrameIndex.estimate(path)
+        return FrameIndex(np.array(timestamps, dtype='<f8'), np.array(keyframes, dtype='<u8'))
+
+    @staticmethod
+    def estimate(path: str) -> 'FrameIndex':
+        video = cv2.VideoCapture(path)
+        try:
+            fps = video.get(cv2.CAP_PROP_FPS)
+            frames = max(int(video.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        finally:
+            video.release()
+        timestamps = np.arange(frames, dtype='<f8') / fps if fps > 0 else np.zeros(frames)
+        return FrameIndex(timestamps, np.array([], dtype='<u8'))
+
+
+class FrameIndexStore:
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory
+        self.__lock = threading.Lock()
+        self.__indexes: Dict[str, Tuple[int, int, FrameIndex]] = {}
+        self.__building: Dict[str, threading.Lock] = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, path: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f'{os.path.basename(path)}.frames')
+
+    def get(self, path: str) -> FrameIndex:
+        stat = os.stat(path)
+        with self.__lock:
+            building = self.__building.setdefault(path, threading.Lock())
+        with building:
+            with self.__lock:
+                cached = self.__indexes.get(path)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                return cached[2]
+            index = self.__load(path, stat)
+            if index is None:
+                index = FrameIndex.build(path)
+                self.__save(path, stat, index)
+            with self.__lock:
+                self.__indexes[path] = (stat.st_mtime_ns, stat.st_size, index)
+            return index
+
+    def __load(self, path: str, stat: os.stat_result) -> Optional[FrameIndex]:
+        index_path = self.path(path)
+        if index_path is None:
+            return None
+        try:
+            with open(index_path, 'rb') as index_file:
+                data = index_file.read()
+            magic, version, frames, keyframes, mtime, size = INDEX_HEADER.unpack_from(data)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION \
+                    or mtime != stat.st_mtime_ns or size != stat.st_size:
+                return None
+            timestamps = np.frombuffer(data, dtype='<f8', count=frames,
+                                       offset=INDEX_HEADER.size)
+            keyframes = np.frombuffer(data, dtype='<u8', count=keyframes,
+                                      offset=INDEX_HEADER.size + timestamps.nbytes)
+        except (OSError, ValueError, struct.error):
+            return None
+        return FrameIndex(timestamps, keyframes)
+
+    def __save(self, path: str, stat: os.stat_result, index: FrameIndex) -> None:
+        index_path = self.path(path)
+        if index_path is None:
+            return
+        with open(f'{index_path}.tmp', 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(index.timestamps),
+                                               len(index.keyframes),
+                                               stat.st_mtime_ns, stat.st_size))
+            index_file.write(index.timestamps.tobytes())
+            index_file.write(index.keyframes.tobytes())
+        os.replace(f'{index_path}.tmp', index_path)
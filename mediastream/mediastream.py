@@ -1,36 +1,68 @@
 from dataclasses import dataclass
 from enum import Enum
-from glob import glob
+from collections import deque
 import os
-import queue
 import threading
-from typing import Any, Callable, Dict, List, Tuple
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 from uuid import UUID, uuid4
 
-import cv2
-
+from common.codec import Buffer, compact_type
+from common.packet import Packet
 from common.tcpserver import TCPServer
+from .adaptation import QualityController, StreamParams
+from .catalog import Catalog, MediaList
+from .decodepool import DecodePool, DecodePoolFullError
+from .framecache import FrameCache, FrameCacheStats, FrameSources
+from .frameindex import FrameIndexStore
+from .segmentstore import SegmentStore
 
 
+@compact_type(32)
 class RequestType(Enum):
     GetList = 0
     StartStream = 1
     GetNextFrame = 2
     CloseStream = 3
+    GetNextFrames = 4
+    GrantCredits = 5
+    GetCacheStats = 6
+    Seek = 7
+    GetStreamStats = 8
 
 
+@compact_type(33)
 @dataclass
 class MediaStreamRequest:
     type: RequestType
     args: Tuple[Any, ...]
 
 
-VIDEO_EXTENSIONS = set(['mp4', 'avi',
-                        'mkv', 'mov',
-                        'flv', 'wmv',
-                        'mpg', 'mpeg',
-                        'm4v', '3gp',
-                        '3g2'])
+@compact_type(34)
+@dataclass
+class FrameBatch:
+    start: int
+    frames: List[Buffer]
+
+
+@compact_type(39)
+@dataclass
+class StreamStats:
+    uid: UUID
+    filename: str
+    fps: float
+    position: int
+    frame: int
+    buffered: int
+    lag: float
+    quality_level: int
+
+
+FRAME_QUEUE_SIZE = 16
+MIN_FRAME_QUEUE_SIZE = 2
+POLL_INTERVAL = 0.1
+IDLE_TIMEOUT = 60.0
 
 
 class StreamingError(Exception):
@@ -39,96 +71,338 @@ class StreamingError(Exception):
 
 class VideoReader:
 
-    def __init__(self, path: str, on_close: Callable[[UUID], None]) -> None:
-        self.__video = cv2.VideoCapture(path)
-        self.__frame_queue = queue.Queue(maxsize=16)
+    def __init__(self, sources: FrameSources, path: str, params: StreamParams,
+                 pool: DecodePool, on_close: Callable[[UUID], None],
+                 client_id: UUID, position: int = 0) -> None:
+        self.client_id = client_id
+        self.__sources = sources
+        self.__pool = pool
+        self.source = sources.acquire(path, params.encoding, position)
+        self.quality = QualityController(params, self.source.size, self.source.fps)
+        self.__frames: Deque[Tuple[int, Buffer]] = deque()
+        self.__buffered_bytes = 0
+        self.__condition = threading.Condition()
         self.__finished = False
+        self.__ended = False
+        self.__error: Optional[Exception] = None
         self.__closed = False
+        self.__scheduled = False
+        self.__decoding = False
+        self.__deadline = 0.0
+        self.__index = position
+        self.__generation = 0
+        self.__position = 0
+        self.__position_lock = threading.Lock()
         self.__on_close = on_close
-        self.fps: float = self.__video.get(cv2.CAP_PROP_FPS)
+        self.fps: float = self.source.fps
+        self.lag = 0.0
+        self.last_active = time.monotonic()
         self.uid = uuid4()
-        self.__reading_thread = threading.Thread(target=self.__read_frames)
-        self.__reading_thread.start()
+        with self.__condition:
+            self.__schedule()
 
-    def __read_frames(self) -> None:
-        while True:
-            if self.finished:
-                return
-            ret, frame = self.__video.read()
-            if not ret:
-                with self.__frame_queue.mutex:
-                    self.__finished = True
+    def __schedule(self) -> None:
+        if self.__scheduled or self.__decoding or self.__finished or self.__ended \
+                or len(self.__frames) >= FRAME_QUEUE_SIZE:
+            return
+        if len(self.__frames) >= MIN_FRAME_QUEUE_SIZE and self.__pool.over_budget:
+            return
+        self.__scheduled = True
+        self.__deadline = time.monotonic()
+        if self.fps > 0:
+            self.__deadline += len(self.__frames) / self.fps
+        self.__pool.submit(self.__deadline, self.__decode)
+
+    def __decode(self) -> None:
+        with self.__condition:
+            self.__scheduled = False
+            if self.__finished:
                 return
-            ret, frame = cv2.imencode('.jpg', frame)
-            if ret:
-                self.__frame_queue.put(frame.tobytes())
+            self.__decoding = True
+            index, generation = self.__index, self.__generation
+        error = None
+        try:
+            if self.quality.encoding != self.source.encoding:
+                source = self.__sources.acquire(self.source.path, self.quality.encoding, index)
+                self.__sources.release(self.source)
+                self.source = source
+            frame = self.source.frame(index)
+        except Exception as e:
+            print(traceback.format_exc())
+            frame, error = None, e
+        with self.__condition:
+            self.__decoding = False
+            self.lag = max(time.monotonic() - self.__deadline, 0.0)
+            if not self.__finished and generation == self.__generation:
+                if frame is None:
+                    self.__ended = True
+                    self.__error = error
+                else:
+                    self.__index = index + 1
+                    if frame:
+                        self.__frames.append((generation, frame))
+                        self.__buffer(len(frame))
+            self.__condition.notify_all()
+            self.__schedule()
+
+    def __buffer(self, size: int) -> None:
+        self.__buffered_bytes += size
+        self.__pool.buffer(size)
+
+    def __clear(self) -> None:
+        self.__frames.clear()
+        self.__buffer(-self.__buffered_bytes)
 
     @property
     def finished(self) -> bool:
-        with self.__frame_queue.mutex:
+        with self.__condition:
             return self.__finished
 
-    def nextframe(self) -> bytes:
-        if self.finished and self.__frame_queue.empty():
+    def nextframe(self) -> Buffer:
+        frames = self.nextframes(1).frames
+        if not frames:
             self.close()
             return None
-        return self.__frame_queue.get()
+        return frames[0]
+
+    def nextframes(self, count: int) -> FrameBatch:
+        with self.__position_lock, self.__condition:
+            frames: List[Buffer] = []
+            while not frames:
+                if (self.__finished or self.__ended) and not self.__frames:
+                    if self.__error is not None and not self.__finished:
+                        raise StreamingError(f'Could not decode frame {self.__index} of '
+                                             f'{os.path.basename(self.source.path)}: '
+                                             f'{self.__error}')
+                    break
+                if not self.__frames:
+                    self.__condition.wait(POLL_INTERVAL)
+                while self.__frames and len(frames) < count:
+                    frames.append(self.__frames.popleft()[1])
+                    self.__buffer(-len(frames[-1]))
+            self.last_active = time.monotonic()
+            self.__schedule()
+            batch = FrameBatch(self.__position, frames)
+            self.__position += len(frames)
+            self.quality.record(len(frames), sum(len(frame) for frame in frames))
+            return batch
+
+    def seek(self, index: int) -> int:
+        with self.__position_lock, self.__condition:
+            if self.__finished:
+                raise StreamingError(f'Stream {self.uid} is closed')
+            self.__index = index
+            self.__generation += 1
+            self.__ended = False
+            self.__error = None
+            self.__clear()
+            self.last_active = time.monotonic()
+            self.__schedule()
+            return self.__position
+
+    def stats(self) -> StreamStats:
+        with self.__condition:
+            return StreamStats(self.uid, os.path.basename(self.source.path), self.fps,
+                               self.__position, self.__index, len(self.__frames), self.lag,
+                               self.quality.level)
 
     def close(self) -> None:
-        with self.__frame_queue.mutex:
+        with self.__condition:
             if self.__closed:
                 return
             self.__finished = True
-            self.__frame_queue.queue.clear()
+            self.__clear()
             self.__closed = True
-        self.__video.release()
+            self.__condition.notify_all()
+            self.__condition.wait_for(lambda: not self.__decoding)
+        self.__sources.release(self.source)
+        self.__pool.leave()
         self.__on_close(self.uid)
-        self.__reading_thread.join()
 
     def __del__(self) -> None:
         self.close()
 
 
+class FrameSender:
+
+    def __init__(self, reader: VideoReader,
+                 push: Callable[[Optional[Buffer]], bool], credits: int) -> None:
+        self.reader = reader
+        self.__push = push
+        self.__credits = credits
+        self.__stopped = False
+        self.__condition = threading.Condition()
+        self.__sending_thread = threading.Thread(target=self.__send_frames, daemon=True)
+        self.__sending_thread.start()
+
+    def grant(self, credits: int) -> None:
+        with self.__condition:
+            self.__credits += credits
+            self.__condition.notify()
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+
+    def __send_frames(self) -> None:
+        interval = 1 / self.reader.fps if self.reader.fps > 0 else 0
+        deadline = time.monotonic()
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__stopped or self.__credits > 0)
+                if self.__stopped:
+                    return
+                self.__credits -= 1
+            try:
+                frames = self.reader.nextframes(1).frames
+            except StreamingError as e:
+                print(e)
+                frames = []
+            if not frames:
+                if not self.__stopped:
+                    self.__push(None)
+                self.reader.close()
+                return
+            deadline = max(deadline + interval, time.monotonic())
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__stopped,
+                                          deadline - time.monotonic())
+                if self.__stopped:
+                    return
+            if not self.__push(frames[0]):
+                self.reader.close()
+                return
+
+
 class MediaStreamServer(TCPServer[MediaStreamRequest, Any]):
 
-    def __init__(self, port: int, root_directory: str) -> None:
-        super().__init__(port)
-        self.files = [os.path.basename(file)
-                      for file in glob(os.path.join(root_directory, '*'))
-                      if file.split('.')[-1] in VIDEO_EXTENSIONS]
+    def __init__(self, port: int, root_directory: str, workers: int = 32,
+                 cache_size: int = 256 * 1024 * 1024,
+                 segments: Optional[SegmentStore] = None,
+                 indexes: Optional[FrameIndexStore] = None,
+                 catalog: Optional[Catalog] = None,
+                 decode_pool: Optional[DecodePool] = None,
+                 idle_timeout: float = IDLE_TIMEOUT) -> None:
+        super().__init__(port, workers)
         self.root_directory = root_directory
+        self.catalog = catalog or Catalog(root_directory)
+        self.catalog.start()
         self.streams: Dict[UUID, VideoReader] = {}
+        self.senders: Dict[UUID, FrameSender] = {}
+        self.indexes = indexes or FrameIndexStore()
+        self.sources = FrameSources(FrameCache(cache_size), segments, self.indexes)
+        self.decode_pool = decode_pool or DecodePool()
+        self.idle_timeout = idle_timeout
+        if idle_timeout > 0:
+            threading.Thread(target=self.__reap_idle_streams, daemon=True).start()
 
-    def handle_request(self, _: UUID, request: MediaStreamRequest) -> Any:
+    def handle_request(self, client_id: UUID, request: MediaStreamRequest) -> Any:
         if request.type == RequestType.GetList:
             return self.get_list(*request.args)
         if request.type == RequestType.StartStream:
-            return self.start_stream(*request.args)
+            return self.start_stream(client_id, *request.args)
+        if request.type == RequestType.GrantCredits:
+            return self.grant_credits(client_id, *request.args)
         if request.type == RequestType.GetNextFrame:
-            return self.get_next_frame(*request.args)
+            return self.get_next_frame(client_id, *request.args)
+        if request.type == RequestType.GetNextFrames:
+            return self.get_next_frames(client_id, *request.args)
+        if request.type == RequestType.Seek:
+            return self.seek(client_id, *request.args)
         if request.type == RequestType.CloseStream:
-            return self.close_stream(*request.args)
+            return self.close_stream(client_id, *request.args)
+        if request.type == RequestType.GetCacheStats:
+            return self.cache_stats()
+        if request.type == RequestType.GetStreamStats:
+            return self.stream_stats()
 
-    def get_list(self) -> List[str]:
-        return self.files
+    def get_list(self, offset: int = 0, limit: int = 0, filter: str = '') -> MediaList:
+        return self.catalog.list(offset, limit, filter)
 
     def __on_close(self, uid: UUID) -> None:
-        del self.streams[uid]
+        with self.lock:
+            reader = self.streams.pop(uid)
+            sender = self.senders.pop(uid, None)
+        if sender is not None:
+            sender.stop()
 
-    def start_stream(self, filename: str) -> Tuple[UUID, float]:
-        if filename not in self.files:
+    def start_stream(self, client_id: UUID, filename: str,
+                     subscription_id: Optional[UUID] = None,
+                     credits: int = 0,
+                     params: Optional[StreamParams] = None,
+                     start: float = 0.0) -> Tuple[UUID, float]:
+        if filename not in self.catalog:
             raise StreamingError(f'File {filename} does not exist')
-        video_reader = VideoReader(os.path.join(self.root_directory, filename),
-                                   on_close=self.__on_close)
-        self.streams[video_reader.uid] = video_reader
+        path = os.path.join(self.root_directory, filename)
+        position = self.indexes.get(path).frame_at(start) if start > 0 else 0
+        try:
+            self.decode_pool.admit()
+        except DecodePoolFullError:
+            raise StreamingError('Server is busy, please try again later') from None
+        try:
+            video_reader = VideoReader(self.sources, path, params or StreamParams(),
+                                       self.decode_pool, self.__on_close, client_id, position)
+        except:
+            self.decode_pool.leave()
+            raise
+        with self.lock:
+            self.streams[video_reader.uid] = video_reader
+            if subscription_id is not None:
+                push = lambda frame: self.push(client_id, Packet(frame, subscription_id))
+                self.senders[video_reader.uid] = FrameSender(video_reader, push, credits)
         return video_reader.uid, video_reader.fps
 
-    def get_next_frame(self, uid: UUID) -> bytes:
-        if uid not in self.streams:
+    def __stream(self, client_id: UUID, uid: UUID) -> VideoReader:
+        with self.lock:
+            reader = self.streams.get(uid)
+        if reader is None or reader.client_id != client_id:
             raise StreamingError(f'Stream {uid} does not exist')
-        return self.streams[uid].nextframe()
+        return reader
 
-    def close_stream(self, uid: UUID) -> None:
-        if uid not in self.streams:
-            raise StreamingError(f'Stream {uid} does not exist')
-        self.streams[uid].close()
+    def grant_credits(self, client_id: UUID, uid: UUID, credits: int) -> None:
+        with self.lock:
+            sender = self.senders.get(uid)
+        if sender is not None and sender.reader.client_id == client_id:
+            sender.grant(credits)
+
+    def get_next_frame(self, client_id: UUID, uid: UUID) -> Buffer:
+        return self.__stream(client_id, uid).nextframe()
+
+    def get_next_frames(self, client_id: UUID, uid: UUID, count: int) -> FrameBatch:
+        return self.__stream(client_id, uid).nextframes(count)
+
+    def seek(self, client_id: UUID, uid: UUID, seconds: float) -> Tuple[int, float]:
+        reader = self.__stream(client_id, uid)
+        index = self.indexes.get(reader.source.path)
+        frame = index.frame_at(seconds)
+        return reader.seek(frame), index.timestamp(frame)
+
+    def close_stream(self, client_id: UUID, uid: UUID) -> None:
+        self.__stream(client_id, uid).close()
+
+    def cache_stats(self) -> FrameCacheStats:
+        return self.sources.stats()
+
+    def stream_stats(self) -> List[StreamStats]:
+        with self.lock:
+            readers = list(self.streams.values())
+        return [reader.stats() for reader in readers]
+
+    def __reap_idle_streams(self) -> None:
+        while True:
+            time.sleep(min(self.idle_timeout, 1.0))
+            now = time.monotonic()
+            with self.lock:
+                readers = [reader for reader in self.streams.values()
+                           if now - reader.last_active > self.idle_timeout]
+            for reader in readers:
+                print(f'closing idle stream {reader.uid}')
+                reader.close()
+
+    def handle_disconnect(self, client_id: UUID) -> None:
+        with self.lock:
+            readers = [reader for reader in self.streams.values()
+                       if reader.client_id == client_id]
+        for reader in readers:
+            reader.close()
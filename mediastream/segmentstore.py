@@ -0,0 +1,103 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from .framecache import SOURCE_ENCODING, Decoder, Encoding
+
+
+# magic, version, fps, width, height, frames, source mtime, source size
+INDEX_HEADER = struct.Struct('<4sHdIIQQQ')
+INDEX_MAGIC = b'MJPI'
+INDEX_VERSION = 2
+
+
+class Segment:
+
+    def __init__(self, fps: float, size: Tuple[int, int], offsets: np.ndarray,
+                 data: mmap.mmap) -> None:
+        self.fps = fps
+        self.size = size
+        self.offsets = offsets
+        self.__view = memoryview(data)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def frame(self, index: int) -> Optional[memoryview]:
+        if index >= len(self):
+            return None
+        return self.__view[self.offsets[index]:self.offsets[index + 1]]
+
+
+class SegmentStore:
+
+    def __init__(self, directory: str, encoding: Encoding = SOURCE_ENCODING) -> None:
+        self.directory = directory
+        self.encoding = encoding
+        self.__transcoding_thread: Optional[threading.Thread] = None
+        self.__transcoding_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, path: str) -> Tuple[str, str]:
+        name = os.path.join(self.directory, os.path.basename(path))
+        return f'{name}.mjpeg', f'{name}.index'
+
+    def open(self, path: str) -> Optional[Segment]:
+        data_path, index_path = self.paths(path)
+        try:
+            stat = os.stat(path)
+            with open(index_path, 'rb') as index_file:
+                index = index_file.read()
+            magic, version, fps, width, height, frames, mtime, size = \
+                INDEX_HEADER.unpack_from(index)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION \
+                    or mtime != stat.st_mtime_ns or size != stat.st_size:
+                return None
+            offsets = np.frombuffer(index, dtype='<u8', count=frames + 1,
+                                    offset=INDEX_HEADER.size)
+            with open(data_path, 'rb') as data_file:
+                if os.fstat(data_file.fileno()).st_size != offsets[-1]:
+                    return None
+                data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) \
+                    if offsets[-1] else mmap.mmap(-1, 1)
+        except (OSError, ValueError, struct.error):
+            return None
+        return Segment(fps, (width, height), offsets, data)
+
+    def transcode(self, path: str) -> None:
+        data_path, index_path = self.paths(path)
+        stat = os.stat(path)
+        decoder = Decoder(path, self.encoding)
+        offsets = [0]
+        try:
+            with open(f'{data_path}.tmp', 'wb') as data_file:
+                while (frame := decoder.read()) is not None:
+                    data_file.write(frame)
+                    offsets.append(offsets[-1] + len(frame))
+            with open(f'{index_path}.tmp', 'wb') as index_file:
+                index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION,
+                                                   decoder.fps, *decoder.size,
+                                                   len(offsets) - 1,
+                                                   stat.st_mtime_ns, stat.st_size))
+                index_file.write(np.array(offsets, dtype='<u8').tobytes())
+        finally:
+            decoder.release()
+        os.replace(f'{data_path}.tmp', data_path)
+        os.replace(f'{index_path}.tmp', index_path)
+
+    def transcode_all(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            with self.__transcoding_lock:
+                if self.open(path) is not None:
+                    continue
+                print(f'transcoding {path}')
+                self.transcode(path)
+
+    def transcode_in_background(self, paths: Iterable[str]) -> None:
+        self.__transcoding_thread = threading.Thread(target=self.transcode_all,
+                                                     args=(list(paths),), daemon=True)
+        self.__transcoding_thread.start()
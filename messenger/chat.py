@@ -1,33 +1,126 @@
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import TYPE_CHECKING, List
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
 
 if TYPE_CHECKING:
     from .message import Message
+    from .storage import Storage
     from .user import User
 
 
+TAIL_SIZE = 256
+
+
 @dataclass
 class Chat:
+    members: Tuple['User', ...] = ()
+    id: int = 0
+    storage: Optional['Storage'] = field(default=None, compare=False, repr=False)
     messages: List['Message'] = field(default_factory=list)
+    base: int = 0
+    changes: List[int] = field(default_factory=list)
+    changes_base: int = 0
+    unread: Dict[str, int] = field(default_factory=dict)
+    watermarks: Dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, compare=False, repr=False)
 
     def add_message(self, message: 'Message'):
-        self.messages.append(message)
+        with self.lock:
+            message.seq = self.size
+            self.messages.append(message)
+            self.changes.append(message.seq)
+            if not message.seen:
+                receiver = message.receiver.username
+                self.unread[receiver] = self.unread.get(receiver, 0) + 1
+            if self.storage is None:
+                return
+            committed = self.storage.add_message(self.id, message)
+            self.__evict()
+        committed.wait()
 
     def read_messages(self, user: 'User', count: int) -> List['Message']:
-        messages = self.messages[-count:]
+        with self.lock:
+            messages = self.__range(max(self.size - count, 0) if count else 0, self.size)
+            self.__mark_seen(user, messages)
+            return messages
+
+    def read_messages_since(self, user: 'User', cursor: int) -> Tuple[List['Message'], int]:
+        with self.lock:
+            if self.changes_base <= cursor <= self.revision:
+                seqs: Iterable[int] = sorted(set(self.changes[cursor - self.changes_base:]))
+            else:
+                seqs = range(self.base, self.size)
+            messages = self.__lookup(seqs)
+            self.__mark_seen(user, messages)
+            return messages, self.revision
+
+    def read_messages_before(self, user: 'User', before: Optional[int],
+                             count: int) -> List['Message']:
+        with self.lock:
+            end = self.size if before is None else min(max(before, 0), self.size)
+            messages = self.__range(max(end - count, 0), end)
+            self.__mark_seen(user, messages)
+            return messages
+
+    def __range(self, start: int, end: int) -> List['Message']:
+        messages = []
+        if start < self.base:
+            messages = self.storage.load_messages(self, start, min(end, self.base))
+        return messages + self.messages[max(start - self.base, 0):max(end - self.base, 0)]
+
+    def __lookup(self, seqs: Iterable[int]) -> List['Message']:
+        seqs = list(seqs)
+        stored = [seq for seq in seqs if seq < self.base]
+        loaded = {}
+        if stored:
+            loaded = {message.seq: message for message
+                      in self.storage.load_messages(self, stored[0], stored[-1] + 1)}
+        return [loaded[seq] if seq < self.base else self.messages[seq - self.base]
+                for seq in seqs]
+
+    def __mark_seen(self, user: 'User', messages: List['Message']) -> None:
+        if not self.unread.get(user.username):
+            return
+        watermark = self.watermarks.get(user.username, 0)
         for message in messages:
-            if message.receiver == user:
+            if message.seq >= watermark and not message.seen \
+                    and message.receiver.username == user.username:
                 message.seen = True
-        return messages
+                self.changes.append(message.seq)
+                self.unread[user.username] -= 1
+                if self.storage is not None:
+                    self.storage.mark_seen(self.id, message.seq)
+        while self.base <= watermark < self.size and (
+                self.messages[watermark - self.base].seen
+                or self.messages[watermark - self.base].receiver.username != user.username):
+            watermark += 1
+        if not self.unread[user.username]:
+            watermark = self.size
+        self.watermarks[user.username] = watermark
+
+    def __evict(self) -> None:
+        if len(self.messages) > 2 * TAIL_SIZE:
+            evicted = len(self.messages) - TAIL_SIZE
+            self.base += evicted
+            del self.messages[:evicted]
+        if len(self.changes) > 2 * TAIL_SIZE:
+            evicted = len(self.changes) - TAIL_SIZE
+            self.changes_base += evicted
+            del self.changes[:evicted]
+
+    @property
+    def size(self) -> int:
+        return self.base + len(self.messages)
+
+    @property
+    def revision(self) -> int:
+        return self.changes_base + len(self.changes)
 
     @property
     def last_modified(self) -> datetime:
         return self.messages[-1].timestamp
 
-    def unread_count(self, user: 'User') -> bool:
-        return len([
-            message for message in self.messages
-            if not message.seen and message.receiver == user
-        ])
+    def unread_count(self, user: 'User') -> int:
+        return self.unread.get(user.username, 0)
@@ -0,0 +1,43 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, Optional
+
+from .user import hash_password, verify_password
+
+
+class HasherBusyError(Exception):
+    pass
+
+
+class PasswordHasher:
+
+    def __init__(self, processes: Optional[int] = None, max_pending: int = 64) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending
+        # spawned rather than forked so workers do not inherit the listening socket
+        self.__processes = ProcessPoolExecutor(self.processes,
+                                               multiprocessing.get_context('spawn'))
+        self.__threads = ThreadPoolExecutor(self.processes)
+        self.__pending = threading.BoundedSemaphore(max_pending)
+
+    def hash(self, password: str) -> 'Future[bytes]':
+        return self.__submit(hash_password, password)
+
+    def verify(self, password: str, password_hash: bytes) -> 'Future[bool]':
+        return self.__submit(verify_password, password, password_hash)
+
+    def close(self) -> None:
+        self.__threads.shutdown(cancel_futures=True)
+        self.__processes.shutdown(cancel_futures=True)
+
+    def __submit(self, function: Callable[..., Any], *args: Any) -> Future:
+        if not self.__pending.acquire(blocking=False):
+            raise HasherBusyError(f'{self.max_pending} passwords are already waiting to be hashed')
+        future = self.__threads.submit(self.__run, function, *args)
+        future.add_done_callback(lambda _: self.__pending.release())
+        return future
+
+    def __run(self, function: Callable[..., Any], *args: Any) -> Any:
+        return self.__processes.submit(function, *args).result()
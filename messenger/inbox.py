@@ -0,0 +1,55 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+InboxKey = Tuple[bool, datetime, str]
+
+
+class Inbox:
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__entries: List[InboxKey] = []
+        self.__keys: Dict[str, InboxKey] = {}
+        self.__unread: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def update(self, username: str, last_modified: datetime, unread_count: int) -> None:
+        key = (unread_count > 0, last_modified, username)
+        with self.__lock:
+            self.__unread[username] = unread_count
+            old = self.__keys.get(username)
+            if old == key:
+                return
+            if old is not None:
+                del self.__entries[bisect_left(self.__entries, old)]
+            insort(self.__entries, key)
+            self.__keys[username] = key
+
+    def page(self, offset: int, limit: Optional[int]) -> List[Tuple[str, datetime, int]]:
+        with self.__lock:
+            end = len(self.__entries) - max(offset, 0)
+            start = 0 if limit is None else max(end - limit, 0)
+            return [(username, last_modified, self.__unread[username])
+                    for _, last_modified, username in reversed(self.__entries[start:max(end, 0)])]
+
+
+class Directory:
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__usernames: List[str] = []
+
+    def add(self, username: str) -> None:
+        with self.__lock:
+            insort(self.__usernames, username)
+
+    def search(self, prefix: str, offset: int, limit: int) -> List[str]:
+        with self.__lock:
+            start = bisect_left(self.__usernames, prefix) + max(offset, 0)
+            usernames = self.__usernames[start:start + limit]
+        return [username for username in usernames if username.startswith(prefix)]
@@ -13,3 +13,4 @@ class Message:
     text: str
     timestamp: datetime = field(default_factory=datetime.now)
     seen: bool = False
+    seq: int = -1
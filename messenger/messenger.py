@@ -1,15 +1,29 @@
+from collections import OrderedDict
+from concurrent.futures import Future
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Callable, Dict, List, Tuple, Any
+import secrets
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
 from uuid import UUID
 from enum import Enum
 
+from common.codec import compact_type
+from common.future import then
+from common.packet import Packet
 from common.tcpserver import TCPServer
 from .message import Message
 from .chat import Chat
+from .hasher import HasherBusyError, PasswordHasher
+from .inbox import Directory
+from .storage import Storage, StorageError
 from .user import User
 
 
+SESSION_TTL = 24 * 60 * 60.0
+
+
+@compact_type(16)
 @dataclass
 class InboxItem:
     user: str
@@ -21,9 +35,11 @@ class InboxItem:
         return self.unread_count > 0
 
     def __lt__(self, other: 'InboxItem') -> bool:
-        return self.is_unread < other.is_unread or self.last_modified < other.last_modified
+        return (self.is_unread, self.last_modified, self.user) \
+            < (other.is_unread, other.last_modified, other.user)
 
 
+@compact_type(17)
 @dataclass
 class MessageItem:
     sender: str
@@ -31,6 +47,7 @@ class MessageItem:
     text: str
     timestamp: datetime
     seen: bool
+    seq: int = -1
 
     @staticmethod
     def from_message(message: Message) -> 'MessageItem':
@@ -38,9 +55,25 @@ class MessageItem:
                            message.receiver.username,
                            message.text,
                            message.timestamp,
-                           message.seen)
+                           message.seen,
+                           message.seq)
+
+
+@compact_type(21)
+@dataclass
+class MessagePage:
+    messages: List[MessageItem]
+    cursor: int
 
 
+@compact_type(20)
+@dataclass
+class SeenReceipt:
+    reader: str
+    until: datetime
+
+
+@compact_type(18)
 class RequestType(Enum):
     Signup = 0
     Login = 1
@@ -49,8 +82,15 @@ class RequestType(Enum):
     ReadMessages = 4
     CheckUsername = 5
     Logout = 6
+    Subscribe = 7
+    Unsubscribe = 8
+    ReadMessagesSince = 9
+    ReadMessagesBefore = 10
+    GetContacts = 11
+    Resume = 12
 
 
+@compact_type(19)
 @dataclass
 class MessengerRequest:
     type: RequestType
@@ -83,67 +123,257 @@ def inject_contact(f: Callable):
 
 class Messenger(TCPServer[MessengerRequest, Any]):
 
-    def __init__(self, port: int) -> None:
-        super().__init__(port)
+    def __init__(self, port: int, workers: int = 32,
+                 storage: Optional[Storage] = None,
+                 hasher: Optional[PasswordHasher] = None,
+                 session_ttl: float = SESSION_TTL) -> None:
+        super().__init__(port, workers)
+        self.session_ttl = session_ttl
+        self.storage = storage
+        self.hasher = hasher or PasswordHasher()
         self.users: Dict[str, User] = {}
+        self.directory = Directory()
+        if storage is not None:
+            self.users = storage.recover()
+            for username in self.users:
+                self.directory.add(username)
         self.onlines: Dict[UUID, User] = {}
+        self.sessions: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self.client_sessions: Dict[UUID, str] = {}
+        self.subscriptions: Dict[Tuple[str, str], Dict[UUID, UUID]] = {}
+        self.client_subscriptions: Dict[UUID, Set[Tuple[str, str, UUID]]] = {}
 
     def handle_request(self, client_id: UUID, request: MessengerRequest) -> Any:
         if request.type == RequestType.Signup:
             return self.signup(*request.args)
         if request.type == RequestType.Login:
             return self.login(client_id, *request.args)
+        if request.type == RequestType.Resume:
+            return self.resume(client_id, *request.args)
         if request.type == RequestType.GetInbox:
-            return self.get_inbox(client_id)
+            return self.get_inbox(client_id, *request.args)
+        if request.type == RequestType.GetContacts:
+            return self.get_contacts(client_id, *request.args)
         if request.type == RequestType.SendMessage:
             return self.send_message(client_id, *request.args)
         if request.type == RequestType.ReadMessages:
             return self.read_messages(client_id, *request.args)
+        if request.type == RequestType.ReadMessagesSince:
+            return self.read_messages_since(client_id, *request.args)
+        if request.type == RequestType.ReadMessagesBefore:
+            return self.read_messages_before(client_id, *request.args)
         if request.type == RequestType.CheckUsername:
             return self.checkusername(*request.args)
         if request.type == RequestType.Logout:
             return self.logout(client_id)
+        if request.type == RequestType.Subscribe:
+            return self.subscribe(client_id, *request.args)
+        if request.type == RequestType.Unsubscribe:
+            return self.unsubscribe(client_id, *request.args)
         raise MessengerError(f'Unknown request type {request.type}')
 
     def checkusername(self, username: str) -> bool:
         return username not in self.users
 
-    def signup(self, username: str, password: str) -> None:
+    def signup(self, username: str, password: str) -> 'Future[None]':
         if username in self.users:
             raise MessengerError(f'Username {username} already exists')
-        self.users[username] = User.from_userpass(username, password)
+        return then(self.__hash(self.hasher.hash, password),
+                    lambda password_hash: self.__add_user(User(username, password_hash)))
+
+    def __add_user(self, user: User) -> None:
+        with self.lock:
+            if user.username in self.users:
+                raise MessengerError(f'Username {user.username} already exists')
+            self.users[user.username] = user
+        if self.storage is not None:
+            try:
+                self.storage.add_user(user).wait()
+            except StorageError as e:
+                with self.lock:
+                    del self.users[user.username]
+                raise MessengerError(str(e))
+        self.directory.add(user.username)
 
-    def login(self, client_id: UUID, username: str, password: str) -> None:
+    def login(self, client_id: UUID, username: str, password: str) -> 'Future[str]':
         if username not in self.users:
             raise MessengerError(f'Username {username} not found')
         user = self.users[username]
-        if not user.check_password(password):
+        return then(self.__hash(self.hasher.verify, password, user.password_hash),
+                    lambda valid: self.__start_session(client_id, user, valid))
+
+    def __start_session(self, client_id: UUID, user: User, valid: bool) -> str:
+        if not valid:
             raise MessengerError(f'Invalid password')
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.__prune_sessions()
+            self.__replace_session(client_id, token)
+            self.sessions[token] = (user.username, time.monotonic() + self.session_ttl)
         self.onlines[client_id] = user
+        return token
+
+    def __prune_sessions(self) -> None:
+        now = time.monotonic()
+        while self.sessions:
+            token, (_, expiry) = next(iter(self.sessions.items()))
+            if expiry > now:
+                return
+            del self.sessions[token]
+
+    def __replace_session(self, client_id: UUID, token: str) -> None:
+        previous = self.client_sessions.get(client_id)
+        if previous is not None and previous != token:
+            self.sessions.pop(previous, None)
+        self.client_sessions[client_id] = token
+
+    def __hash(self, hash: Callable[..., Future], *args: Any) -> Future:
+        try:
+            return hash(*args)
+        except HasherBusyError:
+            raise MessengerError('Server is busy, please try again later') from None
+
+    def resume(self, client_id: UUID, token: str) -> str:
+        with self.lock:
+            self.__prune_sessions()
+            if token not in self.sessions:
+                raise MessengerError('Session expired, please login again')
+            self.__replace_session(client_id, token)
+            username, _ = self.sessions[token]
+            self.sessions[token] = (username, time.monotonic() + self.session_ttl)
+            self.sessions.move_to_end(token)
+            user = self.users[username]
+        self.onlines[client_id] = user
+        return user.username
 
     def logout(self, client_id: UUID) -> None:
+        self.__drop_subscriptions(client_id)
+        with self.lock:
+            token = self.client_sessions.pop(client_id, None)
+            self.sessions.pop(token, None)
         del self.onlines[client_id]
 
+    def handle_disconnect(self, client_id: UUID) -> None:
+        self.__drop_subscriptions(client_id)
+        with self.lock:
+            self.client_sessions.pop(client_id, None)
+        self.onlines.pop(client_id, None)
+
     @inject_user
-    def get_inbox(self, user: User) -> List[InboxItem]:
-        inbox = [InboxItem(username, chat.last_modified, chat.unread_count(user))
-                 for username, chat in user.chats.items()]
-        inbox += [InboxItem(username) for username in self.users
-                  if username not in user.chats
-                  and username != user.username]
-        return sorted(inbox, reverse=True)
+    def get_inbox(self, user: User, offset: int = 0,
+                  limit: Optional[int] = None) -> List[InboxItem]:
+        return [InboxItem(username, last_modified, unread_count)
+                for username, last_modified, unread_count in user.inbox.page(offset, limit)]
+
+    @inject_user
+    def get_contacts(self, user: User, prefix: str = '', offset: int = 0,
+                     limit: int = 20) -> List[str]:
+        return self.directory.search(prefix, offset, limit)
 
     @inject_user
     @inject_contact
     def send_message(self, user: User, contact: User, text: str) -> None:
         if contact.username not in user.chats:
-            user.chats[contact.username] = contact.chats[user.username] = Chat()
-        user.chats[contact.username].add_message(Message(user, contact, text))
+            chat = Chat((user, contact), storage=self.storage)
+            if self.storage is not None:
+                self.storage.add_chat(chat)
+            user.chats[contact.username] = contact.chats[user.username] = chat
+        message = Message(user, contact, text)
+        if self.__subscribers(contact.username, user.username):
+            message.seen = True
+        chat = user.chats[contact.username]
+        chat.add_message(message)
+        self.__update_inbox(chat, user, contact)
+        self.__update_inbox(chat, contact, user)
+        item = MessageItem.from_message(message)
+        self.__publish(contact.username, user.username, item)
+        self.__publish(user.username, contact.username, item)
 
     @inject_user
     @inject_contact
     def read_messages(self, user: User, contact: User, count: int) -> List[MessageItem]:
+        chat = self.__chat(user, contact)
+        messages = self.__read(user, contact, lambda: chat.read_messages(user, count))
+        return list(map(MessageItem.from_message, messages))
+
+    @inject_user
+    @inject_contact
+    def read_messages_since(self, user: User, contact: User, cursor: int) -> MessagePage:
+        chat = self.__chat(user, contact)
+        revision = cursor
+
+        def read() -> List[Message]:
+            nonlocal revision
+            messages, revision = chat.read_messages_since(user, cursor)
+            return messages
+
+        messages = self.__read(user, contact, read)
+        return MessagePage(list(map(MessageItem.from_message, messages)), revision)
+
+    @inject_user
+    @inject_contact
+    def read_messages_before(self, user: User, contact: User,
+                             before: Optional[int], count: int) -> List[MessageItem]:
+        chat = self.__chat(user, contact)
+        messages = self.__read(user, contact,
+                               lambda: chat.read_messages_before(user, before, count))
+        return list(map(MessageItem.from_message, messages))
+
+    def __chat(self, user: User, contact: User) -> Chat:
         if contact.username not in user.chats:
             raise MessengerError(f'Contact {contact.username} not found')
-        messages = user.chats[contact.username].read_messages(user, count)
-        return list(map(MessageItem.from_message, messages))
+        return user.chats[contact.username]
+
+    def __read(self, user: User, contact: User,
+               read: Callable[[], List[Message]]) -> List[Message]:
+        chat = user.chats[contact.username]
+        unread = chat.unread_count(user)
+        messages = read()
+        if chat.unread_count(user) < unread:
+            self.__update_inbox(chat, user, contact)
+            seen = [message for message in messages if message.receiver is user]
+            self.__publish(contact.username, user.username,
+                           SeenReceipt(user.username, seen[-1].timestamp))
+        return messages
+
+    def __update_inbox(self, chat: Chat, user: User, contact: User) -> None:
+        user.inbox.update(contact.username, chat.last_modified, chat.unread_count(user))
+
+    def subscribe(self, client_id: UUID, contact_username: str, subscription_id: UUID) -> None:
+        if client_id not in self.onlines:
+            raise MessengerError('Not logged in')
+        if contact_username not in self.users:
+            raise MessengerError(f'User {contact_username} not found')
+        key = (self.onlines[client_id].username, contact_username)
+        with self.lock:
+            self.subscriptions.setdefault(key, {})[subscription_id] = client_id
+            self.client_subscriptions.setdefault(client_id, set()).add(
+                (*key, subscription_id))
+
+    def unsubscribe(self, client_id: UUID, subscription_id: UUID) -> None:
+        with self.lock:
+            subscriptions = self.client_subscriptions.get(client_id, set())
+            for subscription in [subscription for subscription in subscriptions
+                                 if subscription[2] == subscription_id]:
+                subscriptions.discard(subscription)
+                self.__remove_subscription(subscription)
+
+    def __drop_subscriptions(self, client_id: UUID) -> None:
+        with self.lock:
+            for subscription in self.client_subscriptions.pop(client_id, set()):
+                self.__remove_subscription(subscription)
+
+    def __remove_subscription(self, subscription: Tuple[str, str, UUID]) -> None:
+        username, contact_username, subscription_id = subscription
+        subscribers = self.subscriptions.get((username, contact_username), {})
+        subscribers.pop(subscription_id, None)
+        if not subscribers:
+            self.subscriptions.pop((username, contact_username), None)
+
+    def __subscribers(self, username: str, contact_username: str) -> List[Tuple[UUID, UUID]]:
+        with self.lock:
+            return list(self.subscriptions.get((username, contact_username), {}).items())
+
+    def __publish(self, username: str, contact_username: str, item: Any) -> None:
+        for subscription_id, client_id in self.__subscribers(username, contact_username):
+            self.push(client_id, Packet(item, subscription_id))
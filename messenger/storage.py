@@ -0,0 +1,214 @@
+from datetime import datetime
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .chat import TAIL_SIZE, Chat
+from .message import Message
+from .user import User
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    first TEXT NOT NULL,
+    second TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    seen INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS unseen_messages
+    ON messages (chat_id, sender, seq) WHERE seen = 0;
+'''
+
+
+class StorageError(Exception):
+    pass
+
+
+class Commit:
+
+    def __init__(self) -> None:
+        self.__done = threading.Event()
+        self.__error: Optional[sqlite3.Error] = None
+
+    def resolve(self, error: Optional[sqlite3.Error] = None) -> None:
+        self.__error = error
+        self.__done.set()
+
+    def wait(self) -> None:
+        self.__done.wait()
+        if self.__error is not None:
+            raise StorageError(f'Could not save to the database: {self.__error}')
+
+
+Write = Tuple[Optional[str], Tuple[Any, ...], Commit]
+
+
+class Storage:
+
+    def __init__(self, path: str, batch_size: int = 512,
+                 snapshot_interval: float = 60.0) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.snapshot_interval = snapshot_interval
+        self.__writer = sqlite3.connect(path, check_same_thread=False)
+        self.__writer.execute('PRAGMA journal_mode=WAL')
+        self.__writer.execute('PRAGMA synchronous=FULL')
+        self.__writer.executescript(SCHEMA)
+        self.__reader = sqlite3.connect(path, check_same_thread=False)
+        self.__reader_lock = threading.Lock()
+        self.__next_chat_id = self.__writer.execute(
+            'SELECT COALESCE(MAX(id), 0) + 1 FROM chats').fetchone()[0]
+        self.__chat_id_lock = threading.Lock()
+        self.__queue: 'queue.Queue[Write]' = queue.Queue()
+        self.__closed = False
+        self.__writing_thread = threading.Thread(target=self.__write_loop, daemon=True)
+        self.__writing_thread.start()
+
+    def recover(self) -> Dict[str, User]:
+        with self.__reader_lock:
+            users = {username: User(username, password_hash)
+                     for username, password_hash
+                     in self.__reader.execute('SELECT username, password_hash FROM users')}
+            chats = self.__reader.execute('SELECT id, first, second FROM chats').fetchall()
+            for chat_id, first, second in chats:
+                chat = self.__recover_chat(chat_id, users[first], users[second])
+                if chat is None:
+                    continue
+                users[first].chats[second] = users[second].chats[first] = chat
+                for user, contact in ((users[first], users[second]),
+                                      (users[second], users[first])):
+                    user.inbox.update(contact.username, chat.last_modified,
+                                      chat.unread_count(user))
+        return users
+
+    def __recover_chat(self, chat_id: int, first: User, second: User) -> Optional[Chat]:
+        size = self.__reader.execute(
+            'SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE chat_id = ?',
+            (chat_id,)).fetchone()[0]
+        if size == 0:
+            return None
+        chat = Chat((first, second), chat_id, self)
+        chat.messages = self.__select(chat, max(size - TAIL_SIZE, 0), size)
+        chat.base = chat.messages[0].seq
+        # every message changed the revision at most twice: when sent and when
+        # seen, so cursors handed out before the restart are all below this
+        chat.changes_base = 2 * size
+        unseen = self.__reader.execute(
+            'SELECT sender, COUNT(*), MIN(seq) FROM messages '
+            'WHERE chat_id = ? AND seen = 0 GROUP BY sender', (chat_id,))
+        for user in (first, second):
+            chat.watermarks[user.username] = size
+        for sender, count, watermark in unseen:
+            receiver = second if sender == first.username else first
+            chat.unread[receiver.username] = count
+            chat.watermarks[receiver.username] = watermark
+        return chat
+
+    def add_user(self, user: User) -> Commit:
+        return self.__write('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                            user.username, user.password_hash)
+
+    def add_chat(self, chat: Chat) -> Commit:
+        with self.__chat_id_lock:
+            chat.id = self.__next_chat_id
+            self.__next_chat_id += 1
+        first, second = chat.members
+        return self.__write('INSERT INTO chats (id, first, second) VALUES (?, ?, ?)',
+                            chat.id, first.username, second.username)
+
+    def add_message(self, chat_id: int, message: Message) -> Commit:
+        return self.__write('INSERT INTO messages (chat_id, seq, sender, text, timestamp, seen) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            chat_id, message.seq, message.sender.username, message.text,
+                            message.timestamp.isoformat(), int(message.seen))
+
+    def mark_seen(self, chat_id: int, seq: int) -> Commit:
+        return self.__write('UPDATE messages SET seen = 1 WHERE chat_id = ? AND seq = ?',
+                            chat_id, seq)
+
+    def load_messages(self, chat: Chat, start: int, end: int) -> List[Message]:
+        self.flush()
+        with self.__reader_lock:
+            return self.__select(chat, start, end)
+
+    def __select(self, chat: Chat, start: int, end: int) -> List[Message]:
+        members = {member.username: member for member in chat.members}
+        first, second = chat.members
+        rows = self.__reader.execute(
+            'SELECT seq, sender, text, timestamp, seen FROM messages '
+            'WHERE chat_id = ? AND seq >= ? AND seq < ? ORDER BY seq',
+            (chat.id, start, end))
+        return [Message(members[sender], second if sender == first.username else first,
+                        text, datetime.fromisoformat(timestamp), bool(seen), seq)
+                for seq, sender, text, timestamp, seen in rows]
+
+    def flush(self) -> None:
+        self.__write(None).wait()
+
+    def close(self) -> None:
+        self.flush()
+        self.__closed = True
+        self.__write(None).wait()
+        self.__writing_thread.join()
+        self.__writer.close()
+        self.__reader.close()
+
+    def __write(self, sql: Optional[str], *params: Any) -> Commit:
+        commit = Commit()
+        self.__queue.put((sql, params, commit))
+        return commit
+
+    def __write_loop(self) -> None:
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while True:
+            batch = [self.__queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.__writer:
+                    for sql, params, _ in batch:
+                        if sql is not None:
+                            self.__writer.execute(sql, params)
+            except sqlite3.Error:
+                self.__write_each(batch)
+            else:
+                for _, _, commit in batch:
+                    commit.resolve()
+            if time.monotonic() >= next_snapshot:
+                try:
+                    self.__writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                except sqlite3.Error as e:
+                    print(f'could not checkpoint {self.path}: {e}')
+                next_snapshot = time.monotonic() + self.snapshot_interval
+            if self.__closed:
+                return
+
+    def __write_each(self, batch: List[Write]) -> None:
+        for sql, params, commit in batch:
+            if sql is None:
+                commit.resolve()
+                continue
+            try:
+                with self.__writer:
+                    self.__writer.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f'could not write to {self.path}: {e}')
+                commit.resolve(e)
+            else:
+                commit.resolve()
@@ -4,20 +4,30 @@ from typing import TYPE_CHECKING, Dict
 
 import bcrypt
 
+from .inbox import Inbox
+
 if TYPE_CHECKING:
     from .chat import Chat
 
 
+def hash_password(password: str) -> bytes:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+
+
+def verify_password(password: str, password_hash: bytes) -> bool:
+    return bcrypt.checkpw(password.encode(), password_hash)
+
+
 @dataclass
 class User:
     username: str
     password_hash: bytes
     chats: Dict[str, 'Chat'] = field(default_factory=dict)
+    inbox: Inbox = field(default_factory=Inbox, compare=False, repr=False)
 
     @staticmethod
     def from_userpass(username: str, password: str) -> 'User':
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-        return User(username, password_hash)
+        return User(username, hash_password(password))
 
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode(), self.password_hash)
+        return verify_password(password, self.password_hash)
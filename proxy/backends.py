@@ -0,0 +1,137 @@
+import bisect
+from dataclasses import dataclass
+from enum import Enum
+import hashlib
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .upstream import Address
+
+
+HEALTH_CHECK_INTERVAL = 2.0
+HEALTH_CHECK_TIMEOUT = 1.0
+MAX_FAILURES = 2
+VIRTUAL_NODES = 64
+
+
+class Balancing(Enum):
+    LeastConnections = 'least-connections'
+    ConsistentHash = 'consistent-hash'
+
+
+@dataclass(eq=False)
+class Replica:
+    host: str
+    port: int
+    address: Address
+    connections: int = 0
+    failures: int = 0
+    healthy: bool = True
+
+    def __str__(self) -> str:
+        return f'{self.host}:{self.port}'
+
+
+def resolve(host: str, port: int) -> Replica:
+    return Replica(host, port, (socket.gethostbyname(host), port))
+
+
+def parse_backend(spec: str) -> Tuple[int, List[Replica]]:
+    try:
+        port, replicas = spec.split('=', 1)
+        addresses = [address.rsplit(':', 1) for address in replicas.split(',')]
+        return int(port), [resolve(host or 'localhost', int(number)) for host, number in addresses]
+    except ValueError:
+        raise ValueError(f'invalid backend {spec!r}, expected PORT=HOST:PORT[,HOST:PORT...]')
+    except OSError as e:
+        raise ValueError(f'could not resolve backend {spec!r}: {e}')
+
+
+def point(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class Backend:
+
+    def __init__(self, replicas: List[Replica]) -> None:
+        self.replicas = replicas
+        self.__ring = sorted((point(f'{replica}#{i}'), index)
+                             for index, replica in enumerate(replicas)
+                             for i in range(VIRTUAL_NODES))
+        self.__points = [position for position, _ in self.__ring]
+
+    def choose(self, balancing: Balancing, key: str) -> Replica:
+        healthy = [replica for replica in self.replicas if replica.healthy] or self.replicas
+        if balancing is Balancing.LeastConnections or len(healthy) == 1:
+            return min(healthy, key=lambda replica: replica.connections)
+        start = bisect.bisect(self.__points, point(key))
+        for offset in range(len(self.__ring)):
+            replica = self.replicas[self.__ring[(start + offset) % len(self.__ring)][1]]
+            if replica in healthy:
+                return replica
+        return healthy[0]
+
+
+class BackendMap:
+
+    def __init__(self, backends: Optional[Dict[int, List[Replica]]] = None,
+                 balancing: Balancing = Balancing.LeastConnections,
+                 check_interval: float = HEALTH_CHECK_INTERVAL,
+                 check_timeout: float = HEALTH_CHECK_TIMEOUT,
+                 max_failures: int = MAX_FAILURES) -> None:
+        self.backends = {port: Backend(replicas) for port, replicas in (backends or {}).items()}
+        self.balancing = balancing
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.max_failures = max_failures
+        self.__lock = threading.Lock()
+        self.__localhost = socket.gethostbyname('localhost')
+        self.__thread: Optional[threading.Thread] = None
+
+    def acquire(self, port: int, peer: Any) -> Replica:
+        with self.__lock:
+            backend = self.backends.get(port)
+            if backend is None:
+                chosen = Replica('localhost', port, (self.__localhost, port))
+            else:
+                chosen = backend.choose(self.balancing, str(peer[0]))
+            chosen.connections += 1
+            return chosen
+
+    def release(self, replica: Replica) -> None:
+        with self.__lock:
+            replica.connections -= 1
+
+    def report(self, replica: Replica, ok: bool) -> None:
+        with self.__lock:
+            if ok:
+                replica.failures = 0
+                if not replica.healthy:
+                    replica.healthy = True
+                    print(f'replica {replica} is back')
+                return
+            replica.failures += 1
+            if replica.healthy and replica.failures >= self.max_failures:
+                replica.healthy = False
+                print(f'ejecting replica {replica}')
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__thread is not None or not self.backends:
+                return
+            self.__thread = threading.Thread(target=self.__check, daemon=True)
+            self.__thread.start()
+
+    def __check(self) -> None:
+        while True:
+            time.sleep(self.check_interval)
+            for backend in self.backends.values():
+                for replica in backend.replicas:
+                    try:
+                        socket.create_connection(replica.address, self.check_timeout).close()
+                    except OSError:
+                        self.report(replica, False)
+                    else:
+                        self.report(replica, True)
@@ -0,0 +1,141 @@
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LIFETIME_BUCKETS = (1.0, 10.0, 60.0, 300.0, 1800.0, 3600.0, 21600.0)
+METRICS_INTERVAL = 10.0
+OTHER_PORTS = 0
+MAX_PORT_SERIES = 64
+
+
+class Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other: 'Histogram') -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class PortMetrics:
+
+    def __init__(self) -> None:
+        self.opened = 0
+        self.closed = 0
+        self.failed = 0
+        self.handshake_failures = 0
+        self.bytes_upstream = 0
+        self.bytes_downstream = 0
+        self.queue_wait = Histogram(LATENCY_BUCKETS)
+        self.connect_latency = Histogram(LATENCY_BUCKETS)
+        self.lifetime = Histogram(LIFETIME_BUCKETS)
+
+    @property
+    def active(self) -> int:
+        return self.opened - self.closed
+
+    def merge(self, other: 'PortMetrics') -> None:
+        self.opened += other.opened
+        self.closed += other.closed
+        self.failed += other.failed
+        self.handshake_failures += other.handshake_failures
+        self.bytes_upstream += other.bytes_upstream
+        self.bytes_downstream += other.bytes_downstream
+        self.queue_wait.merge(other.queue_wait)
+        self.connect_latency.merge(other.connect_latency)
+        self.lifetime.merge(other.lifetime)
+
+
+def merge(snapshots: List[Dict[int, PortMetrics]]) -> Dict[int, PortMetrics]:
+    merged: Dict[int, PortMetrics] = {}
+    for snapshot in snapshots:
+        for port, metrics in list(snapshot.items()):
+            merged.setdefault(port, PortMetrics()).merge(metrics)
+    return merged
+
+
+def render(metrics: Dict[int, PortMetrics]) -> str:
+    counters = [
+        ('proxy_tunnels_active', 'gauge', 'Open tunnels', lambda m: m.active),
+        ('proxy_tunnels_opened_total', 'counter', 'Tunnels opened', lambda m: m.opened),
+        ('proxy_connect_failures_total', 'counter', 'Failed upstream connects',
+         lambda m: m.failed),
+    ]
+    histograms = [
+        ('proxy_queue_wait_seconds', 'Time accepted clients waited for an event loop',
+         lambda m: m.queue_wait),
+        ('proxy_connect_latency_seconds', 'Time to connect to the upstream',
+         lambda m: m.connect_latency),
+        ('proxy_tunnel_lifetime_seconds', 'Time from opening to closing a tunnel',
+         lambda m: m.lifetime),
+    ]
+    ports = [('other' if port == OTHER_PORTS else port, m) for port, m in sorted(metrics.items())]
+    lines = []
+    for name, kind, description, value in counters:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{port="{port}"}} {value(m)}' for port, m in ports]
+    lines += ['# HELP proxy_handshake_failures_total Clients that failed to name a target port',
+              '# TYPE proxy_handshake_failures_total counter',
+              f'proxy_handshake_failures_total {sum(m.handshake_failures for _, m in ports)}']
+    lines += ['# HELP proxy_bytes_total Bytes relayed', '# TYPE proxy_bytes_total counter']
+    for port, m in ports:
+        lines.append(f'proxy_bytes_total{{port="{port}",direction="upstream"}} {m.bytes_upstream}')
+        lines.append(f'proxy_bytes_total{{port="{port}",direction="downstream"}} '
+                     f'{m.bytes_downstream}')
+    for name, description, histogram in histograms:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for port, m in ports:
+            lines += histogram(m).render(name, f'port="{port}"')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsWriter:
+
+    def __init__(self, path: str, collect: Callable[[], Dict[int, PortMetrics]],
+                 interval: float = METRICS_INTERVAL) -> None:
+        self.path = path
+        self.interval = interval
+        self.__collect = collect
+        self.__thread: Optional[threading.Thread] = None
+
+    def write(self) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            file.write(render(self.__collect()))
+        os.replace(temporary, self.path)
+
+    def start(self) -> None:
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def __run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                print(f'could not write metrics to {self.path}: {e}')
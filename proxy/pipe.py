@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+import os
+import socket
+
+
+BUFFER_SIZE = 256 * 1024
+SPLICE_SUPPORTED = hasattr(os, 'splice')
+
+
+class Pipe(ABC):
+
+    def __init__(self, src: socket.socket, dst: socket.socket) -> None:
+        self.src = src
+        self.dst = dst
+        self.eof = False
+        self.closed = False
+
+    @property
+    @abstractmethod
+    def readable(self) -> bool:
+        pass
+
+    @property
+    @abstractmethod
+    def writable(self) -> bool:
+        pass
+
+    @abstractmethod
+    def read(self) -> int:
+        pass
+
+    @abstractmethod
+    def write(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        if self.eof and not self.writable and not self.closed:
+            self.closed = True
+            self.dst.shutdown(socket.SHUT_WR)
+
+    def close(self) -> None:
+        pass
+
+
+class BufferedPipe(Pipe):
+
+    def __init__(self, src: socket.socket, dst: socket.socket,
+                 scratch: memoryview, data: bytes = b'') -> None:
+        super().__init__(src, dst)
+        self.__scratch = scratch
+        self.__backlog = bytearray(data)
+
+    @property
+    def readable(self) -> bool:
+        return not self.eof and not self.__backlog
+
+    @property
+    def writable(self) -> bool:
+        return bool(self.__backlog)
+
+    def read(self) -> int:
+        try:
+            received = self.src.recv_into(self.__scratch)
+        except BlockingIOError:
+            return 0
+        if not received:
+            self.eof = True
+            return 0
+        try:
+            sent = self.dst.send(self.__scratch[:received])
+        except BlockingIOError:
+            sent = 0
+        if sent < received:
+            self.__backlog += self.__scratch[sent:received]
+        return received
+
+    def write(self) -> None:
+        try:
+            sent = self.dst.send(self.__backlog)
+        except BlockingIOError:
+            return
+        del self.__backlog[:sent]
+
+
+class SplicePipe(Pipe):
+
+    def __init__(self, src: socket.socket, dst: socket.socket, data: bytes = b'') -> None:
+        super().__init__(src, dst)
+        self.__read_fd, self.__write_fd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        try:
+            import fcntl
+            self.__capacity = fcntl.fcntl(self.__write_fd, fcntl.F_SETPIPE_SZ, BUFFER_SIZE)
+        except (ImportError, AttributeError, OSError):
+            self.__capacity = 64 * 1024
+        self.__pending = os.write(self.__write_fd, data) if data else 0
+        self.__full = False
+
+    @property
+    def readable(self) -> bool:
+        return not self.eof and not self.__full and self.__pending < self.__capacity
+
+    @property
+    def writable(self) -> bool:
+        return self.__pending > 0
+
+    def read(self) -> int:
+        try:
+            received = os.splice(self.src.fileno(), self.__write_fd,
+                                 self.__capacity - self.__pending,
+                                 flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+        except BlockingIOError:
+            self.__full = self.__pending > 0
+            return 0
+        if not received:
+            self.eof = True
+            return 0
+        self.__pending += received
+        self.write()
+        return received
+
+    def write(self) -> None:
+        try:
+            sent = os.splice(self.__read_fd, self.dst.fileno(), self.__pending,
+                             flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+        except BlockingIOError:
+            return
+        self.__pending -= sent
+        if sent:
+            self.__full = False
+
+    def close(self) -> None:
+        os.close(self.__read_fd)
+        os.close(self.__write_fd)
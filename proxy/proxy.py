@@ -1,37 +1,63 @@
 import socket
-import argparse
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from typing import Dict, List, Optional
 
+from .backends import BackendMap, resolve
+from .metrics import METRICS_INTERVAL, MetricsWriter, PortMetrics, merge
+from .pipe import SPLICE_SUPPORTED
+from .relay import HANDSHAKE_TIMEOUT, Relay
+from .upstream import CONNECT_TIMEOUT, UpstreamPool
 
-def send(src: socket.socket, dst: socket.socket, close_other: bool = False):
-    while True:
-        data = src.recv(4096)
-        if not data:
-            print(f'closing connection from {src.getpeername()}')
-            if close_other:
-                dst.close()
-            break
-        dst.send(data)
 
+ACCEPT_BACKOFF = 0.1
 
-parser = argparse.ArgumentParser(description='Proxy server')
-parser.add_argument('-p', '--port', type=int,
-                    default=8080, help='Port to listen on')
-args = parser.parse_args()
+class Proxy:
 
-with ThreadPoolExecutor(max_workers=8) as executor:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.bind(('', args.port))
-        sock.listen(5)
+    def __init__(self, port: int, threads: int = 1, splice: bool = SPLICE_SUPPORTED,
+                 pool_size: int = 0, connect_timeout: float = CONNECT_TIMEOUT,
+                 handshake_timeout: float = HANDSHAKE_TIMEOUT,
+                 backends: Optional[BackendMap] = None,
+                 metrics_file: Optional[str] = None,
+                 metrics_interval: float = METRICS_INTERVAL,
+                 pool_ports: Optional[List[int]] = None) -> None:
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('', port))
+        self.backends = backends if backends is not None else BackendMap()
+        self.pool: Optional[UpstreamPool] = None
+        if pool_size > 0:
+            addresses = [replica.address for backend in self.backends.backends.values()
+                         for replica in backend.replicas]
+            addresses += [resolve('localhost', port).address for port in pool_ports or []]
+            self.pool = UpstreamPool(pool_size, connect_timeout, addresses)
+        self.relays: List[Relay] = [Relay(self.backends, splice, self.pool,
+                                          connect_timeout, handshake_timeout)
+                                    for _ in range(max(threads, 1))]
+        self.metrics_writer: Optional[MetricsWriter] = \
+            MetricsWriter(metrics_file, self.metrics, metrics_interval) if metrics_file else None
 
-        while True:
-            client, _ = sock.accept()
-            print(f'accepted connection from {client.getpeername()}')
-            fd = client.makefile('r', encoding='utf-8')
-            target_port = int(fd.readline())
-            print(f'connecting to {target_port}')
-            target_connection = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            target_connection.connect(('localhost', target_port))
-            executor.submit(send, client, target_connection, close_other=True)
-            executor.submit(send, target_connection, client)
+    def metrics(self) -> Dict[int, PortMetrics]:
+        return merge([relay.metrics for relay in self.relays])
+
+    def listen(self) -> None:
+        self.backends.start()
+        if self.metrics_writer is not None:
+            self.metrics_writer.start()
+        for relay in self.relays:
+            threading.Thread(target=relay.run, daemon=True).start()
+        try:
+            self.sock.listen(socket.SOMAXCONN)
+            while True:
+                try:
+                    client, peer = self.sock.accept()
+                except OSError as e:
+                    if self.sock.fileno() < 0:
+                        raise
+                    print(f'could not accept a connection: {e}')
+                    time.sleep(ACCEPT_BACKOFF)
+                    continue
+                print(f'accepted connection from {peer}')
+                min(self.relays, key=lambda relay: relay.tunnels).add(client, peer)
+        finally:
+            self.sock.close()
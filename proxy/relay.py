@@ -0,0 +1,368 @@
+from collections import deque
+from dataclasses import dataclass, field
+import errno
+import heapq
+import itertools
+import os
+import selectors
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .backends import BackendMap, Replica
+from .metrics import MAX_PORT_SERIES, OTHER_PORTS, PortMetrics
+from .pipe import BufferedPipe, Pipe, SPLICE_SUPPORTED, SplicePipe
+from .upstream import CONNECT_TIMEOUT, UpstreamPool
+
+
+RECV_SIZE = 256 * 1024
+MAX_HANDSHAKE = 64
+HANDSHAKE_TIMEOUT = 10.0
+
+
+class HandshakeError(Exception):
+    pass
+
+
+class Tunnel:
+
+    def __init__(self, client: socket.socket, upstream: socket.socket, peer: Any,
+                 replica: Replica, metrics: PortMetrics,
+                 requests: Pipe, responses: Pipe) -> None:
+        self.client = client
+        self.upstream = upstream
+        self.peer = peer
+        self.replica = replica
+        self.metrics = metrics
+        self.pipes = (requests, responses)
+        self.opened = time.monotonic()
+
+    @property
+    def done(self) -> bool:
+        return all(pipe.closed for pipe in self.pipes)
+
+    def events(self, sock: socket.socket) -> int:
+        events = 0
+        for pipe in self.pipes:
+            if pipe.src is sock and pipe.readable:
+                events |= selectors.EVENT_READ
+            if pipe.dst is sock and pipe.writable:
+                events |= selectors.EVENT_WRITE
+        return events
+
+    def handle(self, sock: socket.socket, mask: int) -> None:
+        requests, responses = self.pipes
+        if mask & selectors.EVENT_READ:
+            if requests.src is sock and requests.readable:
+                self.metrics.bytes_upstream += requests.read()
+            if responses.src is sock and responses.readable:
+                self.metrics.bytes_downstream += responses.read()
+        for pipe in self.pipes:
+            if pipe.writable:
+                pipe.write()
+            pipe.finish()
+
+    def close(self) -> None:
+        for pipe in self.pipes:
+            pipe.close()
+        self.client.close()
+        self.upstream.close()
+
+
+@dataclass
+class Handshake:
+    client: socket.socket
+    peer: Any
+    waited: float
+    data: bytearray = field(default_factory=bytearray)
+    port: int = 0
+    replica: Optional[Replica] = None
+    upstream: Optional[socket.socket] = None
+    dialed: float = 0.0
+
+
+class Relay:
+
+    def __init__(self, backends: BackendMap,
+                 splice: bool = SPLICE_SUPPORTED,
+                 pool: Optional[UpstreamPool] = None,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 handshake_timeout: float = HANDSHAKE_TIMEOUT) -> None:
+        self.__backends = backends
+        self.__splice = splice
+        self.__pool = pool
+        self.__connect_timeout = connect_timeout
+        self.__handshake_timeout = handshake_timeout
+        self.__scratch = memoryview(bytearray(RECV_SIZE))
+        self.__selector = selectors.DefaultSelector()
+        self.__pending: Deque[Tuple[socket.socket, Any, float]] = deque()
+        self.__lock = threading.Lock()
+        self.__waker, self.__wakeup = socket.socketpair()
+        self.__waker.setblocking(False)
+        self.__wakeup.setblocking(False)
+        self.__selector.register(self.__waker, selectors.EVENT_READ, self.__wake)
+        self.__timers: List[Tuple[float, int, Callable[[Handshake], None], Handshake]] = []
+        self.__order = itertools.count()
+        self.__handshakes: Dict[socket.socket, Handshake] = {}
+        self.__connecting: Dict[socket.socket, Handshake] = {}
+        self.__tunnels: Set[Tunnel] = set()
+        self.metrics: Dict[int, PortMetrics] = {}
+
+    @property
+    def tunnels(self) -> int:
+        return len(self.__tunnels)
+
+    def add(self, client: socket.socket, peer: Any) -> None:
+        with self.__lock:
+            self.__pending.append((client, peer, time.monotonic()))
+        try:
+            self.__wakeup.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def run(self) -> None:
+        while True:
+            timeout = max(self.__timers[0][0] - time.monotonic(), 0) if self.__timers else None
+            for key, mask in self.__selector.select(timeout):
+                try:
+                    key.data(key.fileobj, mask)
+                except Exception:
+                    print(traceback.format_exc())
+                    self.__recover(key.fileobj)
+            now = time.monotonic()
+            while self.__timers and self.__timers[0][0] <= now:
+                _, _, callback, handshake = heapq.heappop(self.__timers)
+                try:
+                    callback(handshake)
+                except Exception:
+                    print(traceback.format_exc())
+                    self.__abort(handshake)
+
+    def __schedule(self, delay: float, callback: Callable[[Handshake], None],
+                   handshake: Handshake) -> None:
+        heapq.heappush(self.__timers, (time.monotonic() + delay, next(self.__order),
+                                       callback, handshake))
+
+    def __recover(self, sock: socket.socket) -> None:
+        handshake = self.__handshakes.get(sock) or self.__connecting.get(sock)
+        if handshake is not None:
+            self.__abort(handshake)
+            return
+        tunnel = next((tunnel for tunnel in self.__tunnels
+                       if sock in (tunnel.client, tunnel.upstream)), None)
+        if tunnel is not None:
+            self.__close(tunnel)
+
+    def __abort(self, handshake: Handshake) -> None:
+        for sock in (handshake.client, handshake.upstream):
+            if sock is not None and self.__key(sock) is not None:
+                self.__selector.unregister(sock)
+        self.__handshakes.pop(handshake.client, None)
+        if handshake.upstream is not None:
+            self.__connecting.pop(handshake.upstream, None)
+            handshake.upstream.close()
+        if handshake.replica is not None:
+            self.__backends.release(handshake.replica)
+        handshake.client.close()
+
+    def __wake(self, sock: socket.socket, _: int) -> None:
+        try:
+            sock.recv(4096)
+        except BlockingIOError:
+            pass
+        with self.__lock:
+            clients, self.__pending = self.__pending, deque()
+        now = time.monotonic()
+        for client, peer, accepted in clients:
+            handshake = Handshake(client, peer, now - accepted)
+            try:
+                client.setblocking(False)
+                self.__selector.register(client, selectors.EVENT_READ, self.__handshake)
+            except (OSError, ValueError) as e:
+                print(f'could not watch connection from {peer}: {e}')
+                client.close()
+                continue
+            self.__handshakes[client] = handshake
+            self.__schedule(self.__handshake_timeout, self.__expire_handshake, handshake)
+
+    def __handshake(self, client: socket.socket, _: int) -> None:
+        handshake = self.__handshakes[client]
+        try:
+            chunk = client.recv(MAX_HANDSHAKE)
+            if not chunk:
+                raise HandshakeError('connection closed before handshake')
+            handshake.data += chunk
+            line, newline, rest = handshake.data.partition(b'\n')
+            if not newline:
+                if len(handshake.data) > MAX_HANDSHAKE:
+                    raise HandshakeError('handshake is too long')
+                return
+            handshake.port = self.__parse(line)
+        except BlockingIOError:
+            return
+        except (OSError, HandshakeError) as e:
+            print(f'handshake failed: {e}')
+            self.__metrics(OTHER_PORTS).handshake_failures += 1
+            self.__drop(handshake)
+            return
+        self.__selector.unregister(client)
+        del self.__handshakes[client]
+        handshake.data = rest
+        self.__dial(handshake)
+
+    def __expire_handshake(self, handshake: Handshake) -> None:
+        if self.__handshakes.get(handshake.client) is handshake:
+            print(f'handshake from {handshake.peer} timed out')
+            self.__metrics(OTHER_PORTS).handshake_failures += 1
+            self.__drop(handshake)
+
+    @staticmethod
+    def __parse(line: bytes) -> int:
+        try:
+            return int(line.decode('utf-8'))
+        except ValueError:
+            raise HandshakeError(f'invalid target port {line!r}')
+
+    def __drop(self, handshake: Handshake) -> None:
+        self.__selector.unregister(handshake.client)
+        del self.__handshakes[handshake.client]
+        handshake.client.close()
+
+    def __dial(self, handshake: Handshake) -> None:
+        handshake.dialed = time.monotonic()
+        replica = handshake.replica = self.__backends.acquire(handshake.port, handshake.peer)
+        upstream = self.__pool.take(replica.address) if self.__pool is not None else None
+        if upstream is not None:
+            handshake.upstream = upstream
+            self.__connected(handshake)
+            return
+        print(f'connecting to {handshake.port} on {replica}')
+        try:
+            upstream = handshake.upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            upstream.setblocking(False)
+            error = upstream.connect_ex(replica.address)
+        except OSError as e:
+            self.__fail(handshake, str(e))
+            return
+        if error not in (0, errno.EINPROGRESS):
+            self.__fail(handshake, os.strerror(error))
+            return
+        self.__connecting[upstream] = handshake
+        self.__selector.register(upstream, selectors.EVENT_WRITE, self.__connect)
+        self.__schedule(self.__connect_timeout, self.__expire_connect, handshake)
+
+    def __connect(self, upstream: socket.socket, _: int) -> None:
+        handshake = self.__connecting.pop(upstream)
+        self.__selector.unregister(upstream)
+        error = upstream.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.__fail(handshake, os.strerror(error))
+        else:
+            self.__backends.report(handshake.replica, True)
+            self.__connected(handshake)
+
+    def __expire_connect(self, handshake: Handshake) -> None:
+        if self.__connecting.get(handshake.upstream) is handshake:
+            del self.__connecting[handshake.upstream]
+            self.__selector.unregister(handshake.upstream)
+            self.__fail(handshake, 'timed out')
+
+    def __fail(self, handshake: Handshake, reason: str) -> None:
+        print(f'could not connect to {handshake.port} on {handshake.replica}: {reason}')
+        metrics = self.__metrics(handshake.port)
+        metrics.queue_wait.observe(handshake.waited)
+        metrics.failed += 1
+        if handshake.upstream is not None:
+            self.__backends.report(handshake.replica, False)
+            handshake.upstream.close()
+        self.__backends.release(handshake.replica)
+        handshake.client.close()
+
+    def __connected(self, handshake: Handshake) -> None:
+        client, upstream = handshake.client, handshake.upstream
+        pipes: List[Pipe] = []
+        try:
+            pipes.append(self.__pipe(client, upstream, bytes(handshake.data)))
+            pipes.append(self.__pipe(upstream, client))
+        except OSError as e:
+            print(f'could not relay to {handshake.port}: {e}')
+            for pipe in pipes:
+                pipe.close()
+            self.__backends.release(handshake.replica)
+            client.close()
+            upstream.close()
+            return
+        metrics = self.__metrics(handshake.port, connected=True)
+        metrics.queue_wait.observe(handshake.waited)
+        metrics.connect_latency.observe(time.monotonic() - handshake.dialed)
+        metrics.opened += 1
+        metrics.bytes_upstream += len(handshake.data)
+        self.__open(Tunnel(client, upstream, handshake.peer, handshake.replica, metrics, *pipes))
+
+    def __metrics(self, port: int, connected: bool = False) -> PortMetrics:
+        metrics = self.metrics.get(port)
+        if metrics is not None:
+            return metrics
+        if not (connected or port in self.__backends.backends) \
+                or len(self.metrics) >= MAX_PORT_SERIES:
+            port = OTHER_PORTS
+        metrics = self.metrics.get(port)
+        if metrics is None:
+            metrics = self.metrics[port] = PortMetrics()
+        return metrics
+
+    def __pipe(self, src: socket.socket, dst: socket.socket, data: bytes = b'') -> Pipe:
+        if self.__splice:
+            return SplicePipe(src, dst, data)
+        return BufferedPipe(src, dst, self.__scratch, data)
+
+    def __open(self, tunnel: Tunnel) -> None:
+        self.__tunnels.add(tunnel)
+        for sock in (tunnel.client, tunnel.upstream):
+            self.__selector.register(sock, selectors.EVENT_READ, self.__relay(tunnel))
+        self.__update(tunnel)
+
+    def __relay(self, tunnel: Tunnel) -> Callable[[socket.socket, int], None]:
+        def relay(sock: socket.socket, mask: int) -> None:
+            if tunnel not in self.__tunnels:
+                return
+            try:
+                tunnel.handle(sock, mask)
+            except OSError:
+                self.__close(tunnel)
+                return
+            if tunnel.done:
+                self.__close(tunnel)
+            else:
+                self.__update(tunnel)
+        return relay
+
+    def __update(self, tunnel: Tunnel) -> None:
+        for sock in (tunnel.client, tunnel.upstream):
+            key = self.__key(sock)
+            events = tunnel.events(sock)
+            if not events and key is not None:
+                self.__selector.unregister(sock)
+            elif events and key is None:
+                self.__selector.register(sock, events, self.__relay(tunnel))
+            elif events and key.events != events:
+                self.__selector.modify(sock, events, key.data)
+
+    def __key(self, sock: socket.socket) -> Optional[selectors.SelectorKey]:
+        try:
+            return self.__selector.get_key(sock)
+        except KeyError:
+            return None
+
+    def __close(self, tunnel: Tunnel) -> None:
+        print(f'closing connection from {tunnel.peer}')
+        for sock in (tunnel.client, tunnel.upstream):
+            if self.__key(sock) is not None:
+                self.__selector.unregister(sock)
+        self.__tunnels.discard(tunnel)
+        self.__backends.release(tunnel.replica)
+        tunnel.metrics.closed += 1
+        tunnel.metrics.lifetime.observe(time.monotonic() - tunnel.opened)
+        tunnel.close()
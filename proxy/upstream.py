@@ -0,0 +1,87 @@
+from collections import deque
+import socket
+import threading
+import time
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+
+CONNECT_TIMEOUT = 5.0
+RETRY_INTERVAL = 1.0
+MAX_FAILURES = 3
+
+Address = Tuple[str, int]
+
+
+def alive(sock: socket.socket) -> bool:
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) != b''
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+class UpstreamPool:
+
+    def __init__(self, size: int, timeout: float = CONNECT_TIMEOUT,
+                 addresses: Iterable[Address] = ()) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.addresses = set(addresses)
+        self.__lock = threading.Lock()
+        self.__wanted = threading.Condition(self.__lock)
+        self.__idle: Dict[Address, Deque[socket.socket]] = {}
+        self.__failed: Dict[Address, float] = {}
+        self.__failures: Dict[Address, int] = {}
+        self.__thread: Optional[threading.Thread] = None
+
+    def take(self, address: Address) -> Optional[socket.socket]:
+        with self.__lock:
+            if address not in self.addresses:
+                return None
+            idle = self.__idle.setdefault(address, deque())
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__fill, daemon=True)
+                self.__thread.start()
+            self.__wanted.notify()
+            while idle:
+                sock = idle.popleft()
+                if alive(sock):
+                    return sock
+                sock.close()
+        return None
+
+    def idle(self, address: Address) -> int:
+        with self.__lock:
+            return len(self.__idle.get(address, ()))
+
+    def __missing(self) -> Optional[Address]:
+        now = time.monotonic()
+        return next((address for address, idle in self.__idle.items()
+                     if len(idle) < self.size
+                     and now - self.__failed.get(address, 0.0) >= RETRY_INTERVAL), None)
+
+    def __fill(self) -> None:
+        while True:
+            with self.__lock:
+                self.__wanted.wait_for(lambda: self.__missing() is not None, RETRY_INTERVAL)
+                address = self.__missing()
+            if address is None:
+                continue
+            try:
+                sock = socket.create_connection(address, self.timeout)
+            except OSError:
+                with self.__lock:
+                    self.__failed[address] = time.monotonic()
+                    self.__failures[address] = self.__failures.get(address, 0) + 1
+                    if self.__failures[address] >= MAX_FAILURES:
+                        print(f'stopped warming {address[0]}:{address[1]} after '
+                              f'{MAX_FAILURES} failed connects')
+                        del self.__failures[address]
+                        for sock in self.__idle.pop(address):
+                            sock.close()
+                continue
+            sock.setblocking(False)
+            with self.__lock:
+                self.__failures.pop(address, None)
+                self.__idle[address].append(sock)
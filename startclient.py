@@ -1,6 +1,17 @@
 import argparse
+from typing import Tuple
 
+from client.media_ui import DECODE_WORKERS, FRAME_BATCH_SIZE
 from client.menu import MainMenu
+from mediastream.adaptation import StreamParams
+
+
+def resolution(value: str) -> Tuple[int, int]:
+    try:
+        width, height = value.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid resolution {value!r}, expected WIDTHxHEIGHT')
 
 
 parser = argparse.ArgumentParser(description='Run a Client')
@@ -8,7 +19,27 @@ parser.add_argument('-m', '--messenger-port', type=int,
                     default=8080, help='Messenger port')
 parser.add_argument('-s', '--stream-port', type=int,
                     default=8081, help='Stream port')
+parser.add_argument('-f', '--prefetch-frames', type=int,
+                    default=4 * FRAME_BATCH_SIZE, help='Video frames to keep in flight')
+parser.add_argument('--pull', action='store_true',
+                    help='Request video frames in batches instead of having them pushed')
+parser.add_argument('-r', '--resolution', type=resolution, default=(0, 0),
+                    help='Maximum video resolution as WIDTHxHEIGHT')
+parser.add_argument('-q', '--quality', type=int, default=95,
+                    help='JPEG quality of video frames (1-100)')
+parser.add_argument('-b', '--max-bitrate', type=int, default=0,
+                    help='Maximum video bitrate in kbit/s, 0 for unlimited')
+parser.add_argument('--fixed-quality', action='store_true',
+                    help='Do not adapt video quality to how fast frames are played')
+parser.add_argument('--decoders', type=int, default=DECODE_WORKERS,
+                    help='Threads decoding received video frames')
+parser.add_argument('--headless', action='store_true',
+                    help='Play videos without a window and report achieved fps and drops')
 
 args = parser.parse_args()
 
-MainMenu(args.messenger_port, args.stream_port).run()
+stream_params = StreamParams(*args.resolution, args.quality, args.max_bitrate * 1000,
+                             not args.fixed_quality)
+
+MainMenu(args.messenger_port, args.stream_port, args.prefetch_frames, not args.pull,
+         stream_params, args.decoders, args.headless).run()
@@ -1,4 +1,11 @@
-from mediastream.mediastream import MediaStreamServer
+import os
+
+from common.asynctcpserver import AsyncTCPServer
+from mediastream.catalog import RESCAN_INTERVAL, Catalog
+from mediastream.decodepool import DEFAULT_BUFFER_BUDGET, DEFAULT_DECODE_WORKERS, DecodePool
+from mediastream.frameindex import FrameIndexStore
+from mediastream.mediastream import IDLE_TIMEOUT, MediaStreamServer
+from mediastream.segmentstore import SegmentStore
 
 
 if __name__ == "__main__":
@@ -9,7 +16,49 @@ if __name__ == "__main__":
                         default=8081, help='Port to listen on')
     parser.add_argument('-d', '--root-directory', type=str,
                         default='./videos', help='Root directory')
+    parser.add_argument('-e', '--engine', choices=['threads', 'asyncio'],
+                        default='threads', help='Server engine')
+    parser.add_argument('-w', '--workers', type=int, default=32,
+                        help='Maximum handler threads')
+    parser.add_argument('-c', '--cache-size', type=int, default=256,
+                        help='Encoded frame cache size in megabytes')
+    parser.add_argument('-t', '--transcode', action='store_true',
+                        help='Serve videos from pre-transcoded MJPEG segments, '
+                             'transcoding new or changed videos in the background')
+    parser.add_argument('--segment-directory', type=str, default=None,
+                        help='Segment directory (ROOT_DIRECTORY/.segments if omitted)')
+    parser.add_argument('--index-directory', type=str, default=None,
+                        help='Frame index and catalog directory '
+                             '(ROOT_DIRECTORY/.index if omitted)')
+    parser.add_argument('--rescan-interval', type=float, default=RESCAN_INTERVAL,
+                        help='Seconds between scans of the root directory for new videos')
+    parser.add_argument('--decode-workers', type=int, default=DEFAULT_DECODE_WORKERS,
+                        help='Threads decoding and encoding frames for all streams')
+    parser.add_argument('--max-streams', type=int, default=0,
+                        help='Maximum concurrently playing streams, 0 for unlimited')
+    parser.add_argument('--frame-buffer', type=int, default=DEFAULT_BUFFER_BUDGET // 1024 // 1024,
+                        help='Megabytes of decoded-ahead frames buffered across all streams')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help='Seconds after which a stream nobody reads from is closed')
     args = parser.parse_args()
 
-    server = MediaStreamServer(args.port, args.root_directory)
+    segments = None
+    if args.transcode:
+        segments = SegmentStore(args.segment_directory
+                                or os.path.join(args.root_directory, '.segments'))
+    index_directory = args.index_directory or os.path.join(args.root_directory, '.index')
+    indexes = FrameIndexStore(index_directory)
+    catalog = Catalog(args.root_directory, os.path.join(index_directory, 'catalog.json'),
+                      args.rescan_interval)
+    if segments is not None:
+        segments.transcode_in_background(os.path.join(args.root_directory, file)
+                                         for file in catalog.names())
+        catalog.subscribe(segments.transcode_in_background)
+    server = MediaStreamServer(args.port, args.root_directory, args.workers,
+                               args.cache_size * 1024 * 1024, segments, indexes, catalog,
+                               DecodePool(args.decode_workers, args.max_streams,
+                                          args.frame_buffer * 1024 * 1024),
+                               args.idle_timeout)
+    if args.engine == 'asyncio':
+        server = AsyncTCPServer(server, max_workers=args.workers)
     server.listen()
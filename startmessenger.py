@@ -1,4 +1,7 @@
-from messenger.messenger import Messenger
+from common.asynctcpserver import AsyncTCPServer
+from messenger.hasher import PasswordHasher
+from messenger.messenger import SESSION_TTL, Messenger
+from messenger.storage import Storage
 
 
 if __name__ == '__main__':
@@ -7,7 +10,23 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run a Messenger server')
     parser.add_argument('-p', '--port', type=int,
                         default=8080, help='Port to listen on')
+    parser.add_argument('-e', '--engine', choices=['threads', 'asyncio'],
+                        default='threads', help='Server engine')
+    parser.add_argument('-w', '--workers', type=int, default=32,
+                        help='Maximum handler threads')
+    parser.add_argument('-D', '--database', type=str, default=None,
+                        help='Database file to persist users and chats (in-memory if omitted)')
+    parser.add_argument('--hash-processes', type=int, default=None,
+                        help='Password hashing processes (number of CPUs if omitted)')
+    parser.add_argument('--max-pending-hashes', type=int, default=64,
+                        help='Signups and logins allowed to wait for hashing')
+    parser.add_argument('--session-ttl', type=float, default=SESSION_TTL,
+                        help='Seconds a login token stays valid after it was issued or last resumed')
     args = parser.parse_args()
 
-    server = Messenger(args.port)
+    storage = Storage(args.database) if args.database else None
+    hasher = PasswordHasher(args.hash_processes, args.max_pending_hashes)
+    server = Messenger(args.port, args.workers, storage, hasher, args.session_ttl)
+    if args.engine == 'asyncio':
+        server = AsyncTCPServer(server, max_workers=args.workers)
     server.listen()
@@ -0,0 +1,58 @@
+import os
+
+from proxy.backends import HEALTH_CHECK_INTERVAL, MAX_FAILURES, Balancing, BackendMap, \
+    parse_backend
+from proxy.metrics import METRICS_INTERVAL
+from proxy.pipe import SPLICE_SUPPORTED
+from proxy.proxy import Proxy
+from proxy.relay import HANDSHAKE_TIMEOUT
+from proxy.upstream import CONNECT_TIMEOUT
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a Proxy server')
+    parser.add_argument('-p', '--port', type=int,
+                        default=8080, help='Port to listen on')
+    parser.add_argument('-t', '--threads', type=int, default=os.cpu_count() or 1,
+                        help='Event loop threads relaying tunnels')
+    parser.add_argument('--no-splice', action='store_true',
+                        help='Copy tunnel data through a user-space buffer instead of '
+                             'splicing it through a kernel pipe')
+    parser.add_argument('--pool-size', type=int, default=0,
+                        help='Idle upstream connections kept open per -b replica and '
+                             '--pool-port')
+    parser.add_argument('--pool-port', type=int, action='append', default=[],
+                        help='Port without a -b backend whose localhost server also gets '
+                             'idle connections (repeatable)')
+    parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT,
+                        help='Seconds to wait for an upstream connection')
+    parser.add_argument('--handshake-timeout', type=float, default=HANDSHAKE_TIMEOUT,
+                        help='Seconds a client has to name its target port')
+    parser.add_argument('-b', '--backend', type=parse_backend, action='append', default=[],
+                        metavar='PORT=HOST:PORT[,HOST:PORT...]',
+                        help='Replicas serving a target port, which is otherwise '
+                             'served by localhost:PORT (repeatable)')
+    parser.add_argument('--balancing', choices=[balancing.value for balancing in Balancing],
+                        default=Balancing.LeastConnections.value,
+                        help='How tunnels are spread over the replicas of a port; consistent-hash '
+                             'keeps each client address on the same replica')
+    parser.add_argument('--health-check-interval', type=float, default=HEALTH_CHECK_INTERVAL,
+                        help='Seconds between connection checks of every replica')
+    parser.add_argument('--max-failures', type=int, default=MAX_FAILURES,
+                        help='Consecutive failed connections after which a replica is '
+                             'ejected until a check succeeds')
+    parser.add_argument('--metrics-file', type=str, default=None,
+                        help='File to periodically write per-port tunnel metrics to in the '
+                             'Prometheus text format')
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                        help='Seconds between writes of the metrics file')
+    args = parser.parse_args()
+
+    backends = BackendMap(dict(args.backend), Balancing(args.balancing),
+                          args.health_check_interval, max_failures=args.max_failures)
+    proxy = Proxy(args.port, args.threads, SPLICE_SUPPORTED and not args.no_splice,
+                  args.pool_size, args.connect_timeout, args.handshake_timeout, backends,
+                  args.metrics_file, args.metrics_interval, args.pool_port)
+    proxy.listen()